@@ -0,0 +1,255 @@
+"""
+End-to-end check cycle benchmark against local YouTube and X fakes.
+
+    python bench/bench_cycle.py [--sizes 100,1000,10000] [--channels 3] [--workers 1] [--shards 1]
+                                [--fixture FILE] [--output FILE] [--compare FILE]
+
+For each channel size, a fresh work directory (config + DB) is set up with
+--channels synthetic channels of that many videos. The channels can also
+be recorded ones, see bench/record_fixture.py. main.check_and_post then
+runs this scenario:
+
+    init     full scan in init mode (the client stops after ~2000 uploads)
+    steady   normal cycle; first every remaining video of the channel is
+             stored, so the tracked refresh covers the whole channel
+    bump     every video gained --bump views (milestones and posts)
+    upload   one new upload per channel
+
+Each cycle reports:
+- wall time
+- YouTube API calls, HTTP requests and quota units
+- DB statements on the cycle's connection
+- peak traced memory (tracemalloc, which slows the run down somewhat)
+- posts queued, and tweets the fake X API received before the outbox
+  drained
+
+Results are written as JSON (default bench/results/cycle-<time>.json).
+--compare prints the ratios against an earlier results file.
+"""
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(base_dir, "src"))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import yaml
+
+from fake_x_server import FakeXServer
+from fake_youtube_server import FakeYouTubeServer
+
+SCENARIO = ("init", "steady", "bump", "upload")
+
+
+@contextlib.contextmanager
+def quiet(verbose):
+    """Hide the bot's output unless --verbose."""
+    if verbose:
+        yield
+        return
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def write_workdir(workdir, channel_ids, args):
+    """config/config.yaml with one target per channel (limits opened up), plus db/."""
+    with open(os.path.join(base_dir, "config", "config.yaml"), encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+    template = config["targets"][0]
+    config["targets"] = [
+        dict(template, artist_name=f"Bench{k}", account_id=f"BENCH{k}", channel_id=channel_id, priority=1)
+        for k, channel_id in enumerate(channel_ids)
+    ]
+    system = config.setdefault("system", {})
+    system["workers"] = args.workers
+    system["shards"] = args.shards
+    system["max_posts_per_run"] = args.max_posts
+    # Measure the work, not the budget: quota and posting pace are effectively unlimited
+    system["quota"] = {"daily_limit": 10 ** 9, "run_budget": 10 ** 9}
+    system.setdefault("x_posting", {}).update(posts_per_hour=10 ** 6, burst=10 ** 6, drain_timeout_seconds=0)
+    system.setdefault("adaptive_polling", {})["enabled"] = args.adaptive
+    # Kept in the work directory instead of the repo's .cache/ (set up in run_size)
+    system.setdefault("response_cache", {})["enabled"] = False
+    os.makedirs(os.path.join(workdir, "config"))
+    os.makedirs(os.path.join(workdir, "db"))
+    with open(os.path.join(workdir, "config", "config.yaml"), "w", encoding="utf-8") as f:
+        yaml.safe_dump(config, f, allow_unicode=True)
+    for k in range(len(channel_ids)):
+        for name in ("CONSUMER_KEY", "CONSUMER_SECRET", "ACCESS_TOKEN", "ACCESS_TOKEN_SECRET"):
+            os.environ[f"BENCH{k}_TWITTER_{name}"] = "bench"
+
+
+def seed_tracked(ctx, youtube, channel_ids):
+    """Store every video of the channels, as if the bot had tracked them for a while."""
+    plans = {plan.channel_id: plan for plan in ctx.plans}
+    for channel_id in channel_ids:
+        artist_name = plans[channel_id].artist_name
+        ctx.db.bulk_update_video_stats(
+            (v["id"], v["title"], artist_name, v["viewCount"]) for v in youtube.channel(channel_id)
+        )
+
+
+def run_cycle(bot, ctx, name, youtube, x_server, statements, verbose):
+    api_before = sum(youtube.api_calls.values())
+    requests_before = youtube.requests
+    tweets_before = len(x_server.tweets)
+    queued_before = sum(ctx.db.outbox_counts().values())
+    statements[0] = 0
+    tracemalloc.reset_peak()
+    started = time.perf_counter()
+    with quiet(verbose):
+        bot.check_and_post(full_scan=name == "init", init_mode=name == "init", ctx=ctx)
+    wall = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    db_statements = statements[0]
+    drain_started = time.perf_counter()
+    ctx.outbox.drain(60)
+    drain = time.perf_counter() - drain_started
+    return {
+        "cycle": name,
+        "wall_s": round(wall, 3),
+        "api_calls": sum(youtube.api_calls.values()) - api_before,
+        "http_requests": youtube.requests - requests_before,
+        "quota_units": ctx.yt_client.quota.run_used,
+        "db_statements": db_statements,
+        "peak_memory_kb": round(peak / 1024),
+        "posts_queued": sum(ctx.db.outbox_counts().values()) - queued_before,
+        "tweets_sent": len(x_server.tweets) - tweets_before,
+        "drain_s": round(drain, 3),
+    }
+
+
+def run_size(size, args):
+    youtube = FakeYouTubeServer(videos_per_channel=size, latency=args.latency).start()
+    x_server = FakeXServer().start()
+    workdir = tempfile.mkdtemp(prefix="bench_cycle_")
+    ctx = None
+    try:
+        if args.fixture:
+            channel_ids = youtube.load_fixture(args.fixture)
+        else:
+            channel_ids = [f"UCbench{size:07d}{k:03d}" for k in range(args.channels)]
+        write_workdir(workdir, channel_ids, args)
+        os.environ["YOUTUBE_API_KEY"] = "bench"
+        os.environ["YOUTUBE_API_HOST"] = youtube.url
+        os.environ["X_API_HOST"] = x_server.url
+
+        # Imported after the environment is set up (main.py loads .env on import)
+        import main as bot
+        from response_cache import ResponseCache
+        with quiet(args.verbose):
+            ctx = bot.BotContext.create(workdir)
+        ctx.yt_client.response_cache = ResponseCache(path=os.path.join(workdir, ".cache", "responses.db"))
+        # Count every statement run on the check cycle's connection
+        statements = [0]
+
+        def count(_):
+            statements[0] += 1
+
+        ctx.db._get_connection().set_trace_callback(count)
+
+        cycles = []
+        for name in SCENARIO:
+            if name == "steady":
+                seed_tracked(ctx, youtube, channel_ids)
+            elif name == "bump":
+                youtube.bump_views(args.bump)
+            elif name == "upload":
+                for channel_id in channel_ids:
+                    youtube.upload(channel_id)
+            result = run_cycle(bot, ctx, name, youtube, x_server, statements, args.verbose)
+            print(json.dumps(dict(result, videos_per_channel=size)))
+            cycles.append(result)
+        return {"videos_per_channel": size, "channels": len(channel_ids), "cycles": cycles}
+    finally:
+        if ctx:
+            with quiet(args.verbose):
+                ctx.close()
+        youtube.stop()
+        x_server.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=base_dir,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, path):
+    """Print new/old ratios of the main metrics, per size and cycle."""
+    with open(path, encoding="utf-8") as f:
+        old = json.load(f)
+    old_cycles = {(run["videos_per_channel"], c["cycle"]): c for run in old["runs"] for c in run["cycles"]}
+    print(f"\nCompared with {path} (commit {old['meta'].get('commit')}), new/old:")
+    for run in results["runs"]:
+        for cycle in run["cycles"]:
+            before = old_cycles.get((run["videos_per_channel"], cycle["cycle"]))
+            if not before:
+                continue
+            ratios = []
+            for key in ("wall_s", "api_calls", "db_statements", "peak_memory_kb"):
+                if before[key]:
+                    ratios.append(f"{key} {cycle[key] / before[key]:.2f}x")
+            print(f"  {run['videos_per_channel']:>6} {cycle['cycle']:<7} " + "  ".join(ratios))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="100,1000,10000",
+                        help="videos per channel, comma separated (up to 50000 works, slowly)")
+    parser.add_argument("--channels", type=int, default=3, help="synthetic channels (targets)")
+    parser.add_argument("--fixture", help="replay recorded channels instead (--sizes then only sets the run label)")
+    parser.add_argument("--workers", type=int, default=1, help="system.workers")
+    parser.add_argument("--shards", type=int, default=1, help="system.shards (worker processes)")
+    parser.add_argument("--max-posts", type=int, default=3, help="system.max_posts_per_run")
+    parser.add_argument("--bump", type=int, default=300000, help="views added before the bump cycle")
+    parser.add_argument("--latency", type=float, default=0.0, help="fake YouTube latency per HTTP request (s)")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="keep adaptive polling on (by default every tracked video is refreshed each cycle)")
+    parser.add_argument("--output", help="results file (default bench/results/cycle-<time>.json)")
+    parser.add_argument("--compare", help="earlier results file to compare with")
+    parser.add_argument("--verbose", action="store_true", help="show the bot's output")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    if args.fixture:
+        sizes = sizes[:1]
+    started = datetime.datetime.now()
+    tracemalloc.start()
+    runs = [run_size(size, args) for size in sizes]
+    tracemalloc.stop()
+
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "started_at": started.isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "args": vars(args),
+        },
+        "runs": runs,
+    }
+    output = args.output or os.path.join(
+        base_dir, "bench", "results", f"cycle-{started.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=1)
+    print(f"Results written to {output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Post outbox against the local fake X API.
+
+    python bench/bench_outbox.py [--accounts 3] [--posts 20] [--latency 0.05] [--fresh-clients]
+
+Queues posts for several accounts in a temporary DB, lets the dispatchers
+send them to bench/fake_x_server.py (which injects 429s and 503s), and
+checks every post ends up sent exactly once. Per-post latency is reported;
+--fresh-clients builds a new XClient (and connection) for every post, as
+the bot did before the client pool, for comparison.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(base_dir, "src"))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from db_manager import DatabaseManager
+from fake_x_server import FakeXServer
+from outbox import PostOutbox
+from x_client import XClient, XClientPool
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--accounts", type=int, default=3)
+    parser.add_argument("--posts", type=int, default=20, help="posts per account")
+    parser.add_argument("--latency", type=float, default=0.05, help="fake API latency (s)")
+    parser.add_argument("--rate-limit-every", type=int, default=9)
+    parser.add_argument("--error-every", type=int, default=7)
+    parser.add_argument("--fresh-clients", action="store_true",
+                        help="build a new client per post instead of using the pool")
+    args = parser.parse_args()
+
+    server = FakeXServer(latency=args.latency, rate_limit_every=args.rate_limit_every,
+                         error_every=args.error_every).start()
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "db", "bench.db")
+        db = DatabaseManager(db_path)
+        accounts = [f"ACC{i}" for i in range(args.accounts)]
+        with db.transaction():
+            for account_id in accounts:
+                for i in range(args.posts):
+                    db.enqueue_post(account_id, f"{account_id}-v{i}", "achieved_1000000", 1000000,
+                                    f"{account_id} post {i}")
+
+        credentials = lambda account_id: (f"ck-{account_id}", "cs", "at", "ats")
+        pool = XClientPool(credentials, api_host=server.url)
+        if args.fresh_clients:
+            def factory(account_id):
+                client = XClient(*credentials(account_id), api_host=server.url)
+                client.api  # the old client always built the v1.1 API object too
+                return client
+        else:
+            factory = pool.get
+        outbox = PostOutbox(db_path, factory, per_hour=360000, burst=5, backoff_seconds=0.2, max_backoff_seconds=2)
+        started = time.perf_counter()
+        outbox.resume(accounts)
+        # Backoff can leave posts scheduled for later: wait until all are sent
+        while db.outbox_counts().get('pending') and time.perf_counter() - started < 60:
+            outbox.drain(60)
+            time.sleep(0.05)
+        elapsed = time.perf_counter() - started
+        stats = outbox.stats()
+        outbox.close()
+        pool.close()
+
+        counts = db.outbox_counts()
+        total = args.accounts * args.posts
+        print(f"posts={total} elapsed={elapsed:.2f}s ({elapsed / total * 1000:.1f} ms/post wall)")
+        print(f"dispatchers: {stats}")
+        print(f"fake X responses: {dict(sorted(server.responses.items()))}")
+        print(f"outbox: {counts}")
+        db.close()
+    server.stop()
+
+    assert counts.get('sent') == total, "not every post was sent"
+    assert len(server.tweets) == len(set(server.tweets)) == total, "duplicate or missing tweets"
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
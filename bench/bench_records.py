@@ -0,0 +1,99 @@
+"""
+Memory footprint of the per-video records, before and after VideoStats.
+
+    python bench/bench_records.py [--records 50000]
+
+Builds the same synthetic videos as
+- the raw videos.list items VideoStatsCache used to keep,
+- the per-upload dicts get_channel_videos used to return (float durations),
+- VideoStats records (int durations),
+and MilestoneEvents as dicts vs the NamedTuple. Prints the bytes allocated
+per record (tracemalloc, ids and titles excluded as they are shared) as
+JSON lines.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tracemalloc
+
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(base_dir, "src"))
+
+from milestones import MilestoneEvent
+from youtube_client import VideoStats
+
+
+def api_item(i, rnd):
+    """A videos.list item with parts statistics, snippet and contentDetails, as parsed from JSON."""
+    body = json.dumps({
+        "kind": "youtube#video",
+        "etag": f"etag{i:08d}",
+        "id": f"vid{i:08d}",
+        "snippet": {
+            "publishedAt": "2024-01-01T00:00:00Z",
+            "channelId": "UCchannel000000000000000",
+            "title": f"Song {i} Music Video",
+            "description": "Official music video.",
+            "thumbnails": {size: {"url": f"https://i.ytimg.com/vi/vid{i:08d}/{size}.jpg", "width": w, "height": h}
+                           for size, w, h in (("default", 120, 90), ("medium", 320, 180), ("high", 480, 360))},
+            "channelTitle": "Artist",
+            "categoryId": "10",
+            "liveBroadcastContent": "none",
+            "localized": {"title": f"Song {i} Music Video", "description": "Official music video."},
+        },
+        "contentDetails": {"duration": "PT4M10S", "dimension": "2d", "definition": "hd",
+                           "caption": "false", "licensedContent": True, "projection": "rectangular"},
+        "statistics": {"viewCount": str(rnd.randint(1000, 300000000)), "likeCount": "1000",
+                       "favoriteCount": "0", "commentCount": "100"},
+    })
+    return body
+
+
+def measure(build, n):
+    """Bytes allocated per record by build(i) for i in range(n), the list itself excluded."""
+    records = [None] * n
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for i in range(n):
+        records[i] = build(i)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return round((after - before) / n, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--records", type=int, default=50000)
+    args = parser.parse_args()
+    n = args.records
+
+    rnd = random.Random(1)
+    ids = [f"vid{i:08d}" for i in range(n)]
+    titles = [f"Song {i} Music Video" for i in range(n)]
+    published = "2024-01-01T00:00:00Z"
+    views = [rnd.randint(1000, 300000000) for _ in range(n)]
+    durations = [rnd.choice([30, 180, 250, 320]) for _ in range(n)]
+    bodies = [api_item(i, rnd) for i in range(n)]
+
+    results = [
+        ("videos.list item (dict)", lambda i: json.loads(bodies[i])),
+        ("video dict, float duration", lambda i: {
+            'id': ids[i], 'title': titles[i], 'published_at': published,
+            'view_count': views[i], 'duration_seconds': float(durations[i])}),
+        ("VideoStats, int duration", lambda i: VideoStats(
+            ids[i], titles[i], views[i], durations[i], published)),
+        ("milestone event dict", lambda i: {
+            'video_id': ids[i], 'action_type': 'achieved', 'milestone_value': views[i] // 1000 * 1000,
+            'view_count': views[i], 'step': 1000, 'trigger': None}),
+        ("MilestoneEvent", lambda i: MilestoneEvent(
+            ids[i], 'achieved', views[i] // 1000 * 1000, views[i], 1000)),
+    ]
+    for name, build in results:
+        print(json.dumps({"record": name, "records": n, "bytes_per_record": measure(build, n)},
+                         ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+ETag response cache: cold vs warm channel enumeration.
+
+    python bench/bench_response_cache.py [--channels 5] [--videos 500] [--latency 0.02]
+
+Enumerates every channel of bench/fake_youtube_server.py twice with an
+empty on-disk response cache, with one new upload in between, and prints
+the cache counters plus bytes downloaded and elapsed time of each pass as
+JSON lines. The second pass should be answered almost entirely with 304s.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(base_dir, "src"))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fake_youtube_server import FakeYouTubeServer
+from response_cache import ResponseCache
+from youtube_client import YouTubeClient
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--channels", type=int, default=5)
+    parser.add_argument("--videos", type=int, default=500, help="videos per channel")
+    parser.add_argument("--latency", type=float, default=0.02, help="stub latency per HTTP request (s)")
+    args = parser.parse_args()
+
+    server = FakeYouTubeServer(videos_per_channel=args.videos, latency=args.latency).start()
+    channel_ids = [f"UCbench{i:06d}" for i in range(args.channels)]
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for run in ("cold", "warm"):
+            # A fresh cache object per pass, like a new process
+            cache = ResponseCache(os.path.join(tmp, "responses.db"))
+            client = YouTubeClient("bench-key", api_host=server.url, batch_requests=False)
+            client.response_cache = cache
+            sent_before = server.bytes_sent
+            started = time.perf_counter()
+            for channel_id in channel_ids:
+                results.setdefault(run, []).append(
+                    [v.id for v in client.get_channel_videos(channel_id, full_scan=True)])
+            print(json.dumps({
+                "pass": run,
+                "elapsed_s": round(time.perf_counter() - started, 3),
+                "kb_downloaded": round((server.bytes_sent - sent_before) / 1024),
+                "not_modified": cache.hits,
+                "changed": cache.changed,
+                "misses": cache.misses,
+                "kb_saved": round(cache.bytes_saved / 1024),
+            }))
+            client.close()
+            cache.close()
+            if run == "cold":
+                server.upload(channel_ids[0])
+    server.stop()
+
+    assert results["warm"][0][1:] == results["cold"][0], "new upload should be on top"
+    assert results["warm"][1:] == results["cold"][1:], "unchanged channels differ"
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
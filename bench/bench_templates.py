@@ -0,0 +1,88 @@
+"""
+Micro-benchmark: message rendering with str.replace vs compiled templates.
+
+    python bench/bench_templates.py [--events 2000] [--repeat 5]
+
+Renders the same batch of milestone events from config/config.yaml both
+ways, checks the messages are identical and prints the timings.
+"""
+import argparse
+import os
+import random
+import sys
+import timeit
+
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(base_dir, "src"))
+
+import yaml
+
+from milestones import MilestoneEvent
+from target_plan import compile_plans
+from templates import event_values, format_number, render_events
+
+
+def legacy_render(events, titles, target, templates):
+    """The per-message str.replace rendering this replaces."""
+    artist_name = target['artist_name']
+    custom_vars = dict(target.get('custom_vars') or {})
+    custom_vars.setdefault('fan_name', 'ファン')
+    custom_vars.setdefault('oshi_mark', '✨')
+    custom_vars.setdefault('cheer_msg', f"{artist_name}最高！")
+    messages = []
+    for event in events:
+        data = {'artist_name': artist_name, 'hashtags': " ".join(target.get('hashtags', []))}
+        data.update(event_values(event, titles[event.video_id]))
+        data.update(custom_vars)
+        template_list = templates['support' if event.is_support else 'achieved']
+        msg = template_list[0] if isinstance(template_list, list) else template_list
+        for key, value in data.items():
+            msg = msg.replace("{" + key + "}", str(value))
+        messages.append(msg)
+    return messages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with open(os.path.join(base_dir, "config", "config.yaml"), encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+    plan = compile_plans(config)[0]
+    templates = config['templates']
+
+    rng = random.Random(0)
+    events, titles = [], {}
+    for i in range(args.events):
+        vid = f"vid{i:06d}"
+        titles[vid] = f"Song {i} (Official Music Video)"
+        milestone = rng.choice([100000, 1000000, 5000000, 10000000, 100000000])
+        if i % 4 == 0:
+            events.append(MilestoneEvent(vid, f"support_{milestone}", milestone,
+                                         milestone - rng.randint(1, 50000), 1000000, "50000"))
+        else:
+            events.append(MilestoneEvent(vid, f"achieved_{milestone}", milestone,
+                                         milestone + rng.randint(0, 50000), 1000000))
+
+    first = lambda pool: pool[0]
+    compiled = render_events(events, titles, plan.templates, choice=first)
+    assert compiled == legacy_render(events, titles, plan.target, templates), "rendered messages differ"
+
+    def run_legacy():
+        format_number.cache_clear()
+        legacy_render(events, titles, plan.target, templates)
+
+    def run_compiled():
+        render_events(events, titles, plan.templates, choice=first)
+
+    for name, fn in (("str.replace", run_legacy), ("compiled", run_compiled)):
+        best = min(timeit.repeat(fn, number=1, repeat=args.repeat))
+        print(f"{name:<12}{best * 1000:>10.2f} ms  ({best / len(events) * 1e6:.2f} us/message)")
+    info = format_number.cache_info()
+    print(f"format_number cache: hits={info.hits} misses={info.misses}")
+
+
+if __name__ == "__main__":
+    main()
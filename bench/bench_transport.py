@@ -0,0 +1,76 @@
+"""
+YouTube transport: httplib2 per thread vs pooled keep-alive vs pooled + batch.
+
+    python bench/bench_transport.py [--videos 2000] [--workers 4] [--latency 0.02]
+
+Runs the same work (one channel enumeration, then a stats refresh of every
+video through VideoStatsCache) against bench/fake_youtube_server.py in each
+mode, checks the results match and prints TCP connections, HTTP requests
+and elapsed time as JSON lines.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(base_dir, "src"))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fake_youtube_server import FakeYouTubeServer
+from youtube_client import VideoStatsCache, YouTubeClient
+
+MODES = {
+    "httplib2": dict(pooled=False, batch_requests=False),
+    "pooled": dict(pooled=True, batch_requests=False),
+    "pooled+batch": dict(pooled=True, batch_requests=True),
+}
+
+
+def run(mode, args):
+    server = FakeYouTubeServer(videos_per_channel=args.videos, latency=args.latency).start()
+    executor = ThreadPoolExecutor(max_workers=args.workers) if args.workers > 1 else None
+    try:
+        client = YouTubeClient("bench-key", api_host=server.url, **MODES[mode])
+        started = time.perf_counter()
+        videos = client.get_channel_videos("UCbench000001", full_scan=True)
+        cache = VideoStatsCache(client, executor=executor)
+        cache.prefetch([v.id for v in videos])
+        elapsed = time.perf_counter() - started
+        views = {v.id: cache.get(v.id).view_count for v in videos}
+        client.close()
+        return views, {
+            "mode": mode,
+            "videos": len(videos),
+            "elapsed_s": round(elapsed, 3),
+            "connections": server.connections,
+            "http_requests": server.requests,
+            "api_calls": sum(server.api_calls.values()),
+            "stats_round_trips": cache.round_trips,
+        }
+    finally:
+        if executor:
+            executor.shutdown()
+        server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--videos", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.02, help="stub latency per HTTP request (s)")
+    args = parser.parse_args()
+
+    baseline = None
+    for mode in MODES:
+        views, result = run(mode, args)
+        if baseline is None:
+            baseline = views
+        assert views == baseline, f"{mode}: results differ"
+        print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
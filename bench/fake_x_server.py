@@ -0,0 +1,105 @@
+"""
+Local fake of the X API v2 tweet endpoint (POST /2/tweets).
+
+    python bench/fake_x_server.py [--port 8089] [--latency 0.05] [--rate-limit-every 5] [--error-every 7]
+
+Point the bot at it with X_API_HOST=http://127.0.0.1:8089. Every
+--rate-limit-every'th request gets a 429 (with x-rate-limit-reset) and every
+--error-every'th a 503, so retries and backoff can be exercised offline.
+"""
+import argparse
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeXServer:
+    def __init__(self, port=0, latency=0.0, rate_limit_every=0, error_every=0, reset_seconds=1):
+        self.latency = latency
+        self.rate_limit_every = rate_limit_every
+        self.error_every = error_every
+        self.reset_seconds = reset_seconds
+        self.tweets = []       # texts of accepted tweets, in order
+        self.responses = {}    # status -> count
+        self._ids = itertools.count(1)
+        self._requests = itertools.count(1)
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status, body, headers=None):
+                with server._lock:
+                    server.responses[status] = server.responses.get(status, 0) + 1
+                payload = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)) or 0)
+                if self.path != "/2/tweets":
+                    return self._reply(404, {"title": "Not Found"})
+                if server.latency:
+                    time.sleep(server.latency)
+                n = next(server._requests)
+                if server.rate_limit_every and n % server.rate_limit_every == 0:
+                    reset = int(time.time()) + server.reset_seconds
+                    return self._reply(429, {"title": "Too Many Requests"},
+                                       {"x-rate-limit-reset": str(reset)})
+                if server.error_every and n % server.error_every == 0:
+                    return self._reply(503, {"title": "Service Unavailable"})
+                text = json.loads(body or b"{}").get("text", "")
+                with server._lock:
+                    server.tweets.append(text)
+                    tweet_id = str(next(server._ids))
+                self._reply(201, {"data": {"id": tweet_id, "text": text}})
+
+        return Handler
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--rate-limit-every", type=int, default=0)
+    parser.add_argument("--error-every", type=int, default=0)
+    args = parser.parse_args()
+    server = FakeXServer(args.port, args.latency, args.rate_limit_every, args.error_every)
+    print(f"Fake X API listening on {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
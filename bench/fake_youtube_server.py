@@ -0,0 +1,247 @@
+"""
+Local stub of the YouTube Data API v3 over real HTTP.
+
+    python bench/fake_youtube_server.py [--port 8090] [--videos 500] [--latency 0.02] [--fixture FILE]
+
+Serves channels.list, playlistItems.list and videos.list for synthetic
+channels (or for channels recorded with bench/record_fixture.py, see
+load_fixture), plus the multipart batch endpoint (POST /batch). Responses carry
+ETags and If-None-Match is answered with 304. It counts TCP connections,
+HTTP requests, 304s and body bytes, so transport changes (keep-alive,
+batching, conditional requests) can be checked offline. Point the bot at
+it with YOUTUBE_API_HOST=http://127.0.0.1:8090.
+"""
+import argparse
+import datetime
+import email.parser
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+class FakeYouTubeServer:
+    def __init__(self, port=0, videos_per_channel=500, latency=0.0, seed=1):
+        self.videos_per_channel = videos_per_channel
+        self.latency = latency
+        self.seed = seed
+        self.connections = 0
+        self.requests = 0
+        self.api_calls = {}   # method -> count, batched calls included
+        self.not_modified = 0
+        self.bytes_sent = 0
+        self._channels = {}   # channel_id -> videos, newest first
+        self._videos = {}     # video_id -> video
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    # --- synthetic data ---
+
+    def channel(self, channel_id):
+        with self._lock:
+            videos = self._channels.get(channel_id)
+            if videos is None:
+                rnd = random.Random(f"{self.seed}:{channel_id}")
+                start = datetime.datetime(2020, 1, 1)
+                videos = []
+                for i in range(self.videos_per_channel):
+                    kind = rnd.choice(["Music Video", "MV", "vlog", "Performance Video"])
+                    video = {
+                        "id": f"{channel_id[-6:]}{i:05d}",
+                        "title": f"Song {i} {kind}",
+                        "publishedAt": (start + datetime.timedelta(hours=i)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+                        "viewCount": rnd.randint(1000, 300000000),
+                        "duration": rnd.choice(["PT30S", "PT3M", "PT4M10S"]),
+                    }
+                    videos.append(video)
+                    self._videos[video["id"]] = video
+                videos.reverse()
+                self._channels[channel_id] = videos
+            return videos
+
+    def load_fixture(self, path):
+        """
+        Serve the channels recorded in a fixture file:
+        {"channels": {channel_id: [video, ...]}} with videos newest first, as
+        {"id", "title", "publishedAt", "viewCount", "duration"}. Returns the
+        channel IDs.
+        """
+        with open(path, encoding="utf-8") as f:
+            fixture = json.load(f)
+        with self._lock:
+            for channel_id, videos in fixture["channels"].items():
+                videos = [dict(v) for v in videos]
+                self._channels[channel_id] = videos
+                for video in videos:
+                    self._videos[video["id"]] = video
+        return list(fixture["channels"])
+
+    def bump_views(self, delta, channel_id=None):
+        """Add `delta` views to every video (of one channel, or of all)."""
+        with self._lock:
+            channels = [self._channels[channel_id]] if channel_id else list(self._channels.values())
+            for videos in channels:
+                for video in videos:
+                    video["viewCount"] += delta
+
+    def call(self, method, params):
+        """Answer one API call: (status, JSON body)."""
+        with self._lock:
+            self.api_calls[method] = self.api_calls.get(method, 0) + 1
+        if method == "channels":
+            channel_id = params.get("id", "")
+            self.channel(channel_id)
+            return 200, {"items": [{"id": channel_id, "contentDetails": {
+                "relatedPlaylists": {"uploads": "UU" + channel_id[2:]}}}]}
+        if method == "playlistItems":
+            videos = self.channel("UC" + params.get("playlistId", "")[2:])
+            start = int(params.get("pageToken") or 0)
+            size = int(params.get("maxResults") or 5)
+            page = videos[start:start + size]
+            body = {"items": [{"snippet": {"title": v["title"], "publishedAt": v["publishedAt"],
+                                           "resourceId": {"videoId": v["id"]}}} for v in page]}
+            if start + size < len(videos):
+                body["nextPageToken"] = str(start + size)
+            return 200, body
+        if method == "videos":
+            items = []
+            for video_id in params.get("id", "").split(","):
+                v = self._videos.get(video_id)
+                if v:
+                    items.append({"id": v["id"], "snippet": {"title": v["title"]},
+                                  "statistics": {"viewCount": str(v["viewCount"])},
+                                  "contentDetails": {"duration": v["duration"]}})
+            return 200, {"items": items}
+        return 404, {"error": {"code": 404, "message": f"Unknown method {method}"}}
+
+    def _call_path(self, path):
+        parts = urlsplit(path)
+        params = {k: v[0] for k, v in parse_qs(parts.query).items()}
+        status, body = self.call(parts.path.rstrip("/").rsplit("/", 1)[-1], params)
+        if status == 200:
+            body["etag"] = hashlib.md5(json.dumps(body, sort_keys=True).encode()).hexdigest()
+        return status, body
+
+    def upload(self, channel_id, title="New Song Music Video"):
+        """Add a new video at the top of a channel (changes its first playlist page)."""
+        videos = self.channel(channel_id)
+        with self._lock:
+            i = len(videos)
+            video = {"id": f"{channel_id[-6:]}{i:05d}", "title": f"{title} {i}",
+                     "publishedAt": (datetime.datetime(2030, 1, 1) + datetime.timedelta(hours=i)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+                     "viewCount": 1000, "duration": "PT4M"}
+            videos.insert(0, video)
+            self._videos[video["id"]] = video
+
+    def _batch(self, content_type, body):
+        """Answer a multipart/mixed batch: (content type, body)."""
+        message = email.parser.BytesParser().parsebytes(
+            b"Content-Type: " + content_type.encode() + b"\r\n\r\n" + body)
+        boundary = uuid.uuid4().hex
+        out = []
+        for part in message.get_payload():
+            request_line = part.get_payload().lstrip().split("\n", 1)[0].strip()
+            _, path, _ = request_line.split(" ", 2)
+            status, result = self._call_path(path)
+            payload = json.dumps(result)
+            content_id = part["Content-ID"].strip("<>")
+            out.append(
+                f"--{boundary}\r\nContent-Type: application/http\r\n"
+                f"Content-ID: <response-{content_id}>\r\n\r\n"
+                f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                f"Content-Type: application/json; charset=UTF-8\r\n\r\n{payload}\r\n"
+            )
+        out.append(f"--{boundary}--\r\n")
+        return f"multipart/mixed; boundary={boundary}", "".join(out).encode("utf-8")
+
+    # --- HTTP ---
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                with server._lock:
+                    server.connections += 1
+
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status, content_type, payload):
+                with server._lock:
+                    server.bytes_sent += len(payload)
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _count(self):
+                with server._lock:
+                    server.requests += 1
+                if server.latency:
+                    time.sleep(server.latency)
+
+            def do_GET(self):
+                self._count()
+                status, result = server._call_path(self.path)
+                etag = result.get("etag")
+                if etag and self.headers.get("If-None-Match") == etag:
+                    with server._lock:
+                        server.not_modified += 1
+                    return self._reply(304, "application/json; charset=UTF-8", b"")
+                self._reply(status, "application/json; charset=UTF-8", json.dumps(result).encode("utf-8"))
+
+            def do_POST(self):
+                self._count()
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if urlsplit(self.path).path != "/batch":
+                    return self._reply(404, "application/json", b'{"error": {"code": 404}}')
+                content_type, payload = server._batch(self.headers["Content-Type"], body)
+                self._reply(200, content_type, payload)
+
+        return Handler
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--videos", type=int, default=500, help="videos per channel")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per HTTP request")
+    parser.add_argument("--fixture", help="serve the channels recorded in this file")
+    args = parser.parse_args()
+    server = FakeYouTubeServer(args.port, args.videos, args.latency)
+    if args.fixture:
+        print(f"Serving {len(server.load_fixture(args.fixture))} recorded channels")
+    print(f"Fake YouTube API listening on {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
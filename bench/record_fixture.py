@@ -0,0 +1,56 @@
+"""
+Record real channels into a fixture for bench/fake_youtube_server.py.
+
+    python bench/record_fixture.py UCxxxx [UCyyyy ...] --output bench/fixtures/idols.json
+
+Enumerates each channel's uploads with the bot's own YouTubeClient
+(YOUTUBE_API_KEY from the environment or .env; about 2 quota units per 50
+videos, at most ~2000 videos per channel) and writes them, newest first,
+in the fixture format served by FakeYouTubeServer.load_fixture().
+Benchmarks can then replay real titles, durations and view counts offline.
+"""
+import argparse
+import json
+import os
+import sys
+
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(base_dir, "src"))
+
+from dotenv import load_dotenv
+
+from youtube_client import YouTubeClient
+
+
+def record_channel(client, channel_id):
+    videos = client.get_channel_videos(channel_id, full_scan=True)
+    return [{"id": v.id, "title": v.title, "publishedAt": v.published_at,
+             "viewCount": v.view_count, "duration": f"PT{v.duration_seconds}S"}
+            for v in videos]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("channels", nargs="+", help="channel IDs to record")
+    parser.add_argument("--output", required=True)
+    args = parser.parse_args()
+
+    load_dotenv(os.path.join(base_dir, ".env"))
+    api_key = os.getenv("YOUTUBE_API_KEY")
+    if not api_key:
+        sys.exit("YOUTUBE_API_KEY not found in environment.")
+    client = YouTubeClient(api_key)
+    fixture = {"channels": {}}
+    try:
+        for channel_id in args.channels:
+            fixture["channels"][channel_id] = record_channel(client, channel_id)
+            print(f"{channel_id}: {len(fixture['channels'][channel_id])} videos")
+    finally:
+        client.close()
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(fixture, f, ensure_ascii=False, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,123 @@
 import sqlite3
 import datetime
 import os
+import time
+from contextlib import contextmanager
+from typing import NamedTuple
+
+import metrics
+
+
+class StoredVideo(NamedTuple):
+    """A row of the videos table."""
+    video_id: str
+    title: str
+    artist: str
+    view_count: int
+    last_updated: str
+
 
 class DatabaseManager:
     def __init__(self, db_path="db/mv_data.db"):
         # Ensure db directory exists
         os.makedirs(os.path.dirname(db_path), exist_ok=True)
         self.db_path = db_path
+        self._conn = None
+        self._tx_depth = 0  # Nesting level of transaction() blocks
+        # In-memory copy of post_history keys (video_id, action_type, milestone_value)
+        # for the videos loaded by load_history(). None means "not loaded".
+        self._history_keys = None
+        self._history_ids = set()
+        # In-memory copy of {video_id: (title, view_count)} for the artist
+        # loaded by load_video_stats(). None means "not loaded".
+        self._video_stats = None
         self._init_db()
 
     def _get_connection(self):
-        return sqlite3.connect(self.db_path)
+        """
+        Return the long-lived connection owned by this manager.
+        The connection is opened lazily and reused for every statement.
+        """
+        if self._conn is None:
+            # Background writers (the post outbox dispatchers) have their own
+            # connection and wait for the check cycle's transaction to commit.
+            conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            # WAL lets readers proceed during writes and turns most commits
+            # into sequential appends instead of full journal rewrites.
+            conn.execute('PRAGMA journal_mode=WAL')
+            # NORMAL is durable across application crashes in WAL mode and
+            # avoids an fsync on every commit.
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA temp_store=MEMORY')
+            conn.execute('PRAGMA cache_size=-16000')  # ~16MB page cache
+            self._conn = conn
+        return self._conn
+
+    def _commit(self):
+        """Commit unless we are inside a transaction() block."""
+        if self._tx_depth == 0:
+            with metrics.span('db.commit'):
+                self._get_connection().commit()
+
+    def rollback(self):
+        """Discard uncommitted writes (e.g. after a statement or commit failed)."""
+        if self._conn is not None:
+            self._conn.rollback()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Unit of work: all writes inside the block are committed once at the end.
+        Blocks can be nested; only the outermost one commits.
+        On an exception, uncommitted writes are rolled back.
+        """
+        conn = self._get_connection()
+        self._tx_depth += 1
+        try:
+            yield self
+        except BaseException:
+            self._tx_depth -= 1
+            if self._tx_depth == 0:
+                conn.rollback()
+                # Rolled-back rows may still be in the in-memory copies
+                self._history_keys = None
+                self._video_stats = None
+            raise
+        else:
+            self._tx_depth -= 1
+            if self._tx_depth == 0:
+                with metrics.span('db.commit'):
+                    conn.commit()
+
+    def checkpoint(self):
+        """Commit pending work and fold the WAL back into the main file."""
+        if self._conn is None:
+            return
+        self._conn.commit()
+        # Keep db/mv_data.db self-contained (copied as the state store baseline)
+        self._conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+    def export_state(self, store):
+        """
+        Write what changed since the last export to a StateStore (snapshot
+        and delta files, see state_store.py). Returns what was written.
+        """
+        self.checkpoint()
+        return store.export(self.db_path)
+
+    def close(self):
+        """Checkpoint and close the connection."""
+        if self._conn is None:
+            return
+        self.checkpoint()
+        self._conn.close()
+        self._conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
 
     def _init_db(self):
         """Initialize the database schema."""
@@ -43,60 +150,492 @@ class DatabaseManager:
         ''')
         
         conn.commit()
-        conn.close()
+        self._migrate()
+
+    # Schema migrations, applied in order and tracked with PRAGMA user_version.
+    # Each entry is (version, [sql statements]). Never edit a released entry;
+    # append a new one instead.
+    _MIGRATIONS = [
+        (1, [
+            # Drop duplicate history rows (keep the oldest) so the unique index can be built
+            '''
+            DELETE FROM post_history WHERE id NOT IN (
+                SELECT MIN(id) FROM post_history
+                GROUP BY video_id, action_type, milestone_value
+            )
+            ''',
+            '''
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_post_history_key
+            ON post_history (video_id, action_type, milestone_value)
+            ''',
+            'CREATE INDEX IF NOT EXISTS idx_videos_artist ON videos (artist)',
+        ]),
+        (2, [
+            # Append-only view count history. ts is unix seconds (UTC).
+            # WITHOUT ROWID stores rows directly in the primary key b-tree,
+            # so each snapshot costs one small record and no separate index.
+            '''
+            CREATE TABLE IF NOT EXISTS view_snapshots (
+                video_id TEXT NOT NULL,
+                ts INTEGER NOT NULL,
+                view_count INTEGER NOT NULL,
+                PRIMARY KEY (video_id, ts)
+            ) WITHOUT ROWID
+            ''',
+        ]),
+        (3, [
+            # YouTube API units used per quota day (Pacific date) and call type
+            '''
+            CREATE TABLE IF NOT EXISTS api_quota_usage (
+                day TEXT NOT NULL,
+                call_type TEXT NOT NULL,
+                units INTEGER NOT NULL,
+                PRIMARY KEY (day, call_type)
+            ) WITHOUT ROWID
+            ''',
+        ]),
+        (4, [
+            # Per-channel sync state: cached uploads playlist ID and the
+            # high-water mark (newest video seen in the uploads playlist)
+            '''
+            CREATE TABLE IF NOT EXISTS channel_state (
+                channel_id TEXT PRIMARY KEY,
+                uploads_playlist_id TEXT,
+                last_video_id TEXT,
+                last_published_at TEXT,
+                last_synced TIMESTAMP
+            )
+            ''',
+        ]),
+        (5, [
+            # Durable queue of X posts, sent in the background per account.
+            # Times are unix seconds. status: pending / sent / failed
+            '''
+            CREATE TABLE IF NOT EXISTS post_outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                account_id TEXT NOT NULL,
+                video_id TEXT NOT NULL,
+                action_type TEXT NOT NULL,
+                milestone_value INTEGER,
+                message TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL,
+                last_error TEXT,
+                tweet_id TEXT,
+                created_at REAL NOT NULL,
+                sent_at REAL,
+                UNIQUE (video_id, action_type, milestone_value)
+            )
+            ''',
+            '''
+            CREATE INDEX IF NOT EXISTS idx_post_outbox_due
+            ON post_outbox (status, account_id, next_attempt_at)
+            ''',
+        ]),
+        (6, [
+            # Local bookkeeping of the snapshot/delta store (state_store.py),
+            # e.g. the store sequence number this DB matches. Not exported.
+            '''
+            CREATE TABLE IF NOT EXISTS state_meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            )
+            ''',
+        ]),
+        (7, [
+            # When each video was last polled (unix seconds). view_snapshots
+            # only gets a row when the view count changed; this keeps the
+            # poll time of stagnant videos for the ETA engine. Local only:
+            # not exported by state_store.py, so polls add no delta rows.
+            '''
+            CREATE TABLE IF NOT EXISTS video_polls (
+                video_id TEXT PRIMARY KEY,
+                polled_at INTEGER NOT NULL
+            ) WITHOUT ROWID
+            ''',
+        ]),
+    ]
+
+    def _migrate(self):
+        """Apply pending schema migrations."""
+        conn = self._get_connection()
+        current = conn.execute('PRAGMA user_version').fetchone()[0]
+        for version, statements in self._MIGRATIONS:
+            if version <= current:
+                continue
+            for sql in statements:
+                conn.execute(sql)
+            # PRAGMA does not accept bound parameters
+            conn.execute(f'PRAGMA user_version = {int(version)}')
+            conn.commit()
+            print(f"DB migrated to schema version {version}")
+
+    _UPSERT_VIDEO_SQL = '''
+        INSERT INTO videos (video_id, title, artist, view_count, last_updated)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(video_id) DO UPDATE SET
+            view_count = excluded.view_count,
+            last_updated = excluded.last_updated,
+            title = excluded.title
+    '''
 
     def update_video_stats(self, video_id, title, artist, view_count):
         """Update or insert video stats."""
+        self.bulk_update_video_stats([(video_id, title, artist, view_count)])
+
+    @metrics.timed('db.bulk_update_video_stats')
+    def bulk_update_video_stats(self, rows):
+        """
+        Update or insert many videos in a single statement batch.
+        rows: iterable of (video_id, title, artist, view_count)
+
+        Only new videos and videos whose title or view count changed are
+        written (nor is last_updated bumped otherwise), and only a changed
+        view count is appended to view_snapshots. The time of every poll
+        goes to the local video_polls table. Stagnant videos therefore
+        change nothing the state store exports.
+        Compares against the copy from load_video_stats() when loaded,
+        otherwise against the stored rows.
+        Returns the number of videos rows inserted or updated.
+        """
+        now = datetime.datetime.now()
+        params = [(vid, title, artist, views, now) for vid, title, artist, views in rows]
+        if not params:
+            return 0
+        known = self._video_stats
+        if known is None:
+            known = self._stored_stats([p[0] for p in params])
+        changed = []
+        snapshots = []
+        for p in params:
+            stored = known.get(p[0])
+            if stored != (p[1], p[3]):
+                changed.append(p)
+                if stored is None or stored[1] != p[3]:
+                    snapshots.append(p)
+                known[p[0]] = (p[1], p[3])
+        metrics.incr('video_rows_changed', len(changed))
+        metrics.incr('video_rows_unchanged', len(params) - len(changed))
         conn = self._get_connection()
-        cursor = conn.cursor()
+        if changed:
+            conn.executemany(self._UPSERT_VIDEO_SQL, changed)
+        ts = int(time.time())
+        if snapshots:
+            conn.executemany(
+                'INSERT OR REPLACE INTO view_snapshots (video_id, ts, view_count) VALUES (?, ?, ?)',
+                [(p[0], ts, p[3]) for p in snapshots]
+            )
+        conn.executemany(
+            'INSERT OR REPLACE INTO video_polls (video_id, polled_at) VALUES (?, ?)',
+            [(p[0], ts) for p in params]
+        )
+        self._commit()
+        return len(changed)
+
+    def _stored_stats(self, video_ids):
+        """{video_id: (title, view_count)} of the given stored videos."""
+        conn = self._get_connection()
+        stats = {}
+        for i in range(0, len(video_ids), 500):
+            chunk = video_ids[i:i + 500]
+            for vid, title, views in conn.execute(f'''
+                SELECT video_id, title, view_count FROM videos
+                WHERE video_id IN ({', '.join('?' * len(chunk))})
+            ''', chunk):
+                stats[vid] = (title, views)
+        return stats
+
+    def get_artist_snapshots(self, artist, since=None):
+        """
+        Return {video_id: [(ts, view_count), ...]} for all of an artist's
+        videos, oldest first, in a single query.
+        """
+        rows = self._get_connection().execute('''
+            SELECT s.video_id, s.ts, s.view_count
+            FROM view_snapshots s
+            JOIN videos v ON v.video_id = s.video_id
+            WHERE v.artist = ? AND s.ts >= ?
+            ORDER BY s.video_id, s.ts
+        ''', (artist, since or 0)).fetchall()
+        history = {}
+        for vid, ts, views in rows:
+            history.setdefault(vid, []).append((ts, views))
+        return history
+
+    def get_artist_polls(self, artist):
+        """Return {video_id: (last poll time, view_count)} for all of an artist's videos."""
+        rows = self._get_connection().execute('''
+            SELECT p.video_id, p.polled_at, v.view_count
+            FROM video_polls p
+            JOIN videos v ON v.video_id = p.video_id
+            WHERE v.artist = ?
+        ''', (artist,)).fetchall()
+        return {vid: (polled_at, views) for vid, polled_at, views in rows}
+
+    def get_channel_state(self, channel_id):
+        """Return the channel's sync state as a dict, or None if never synced."""
+        row = self._get_connection().execute('''
+            SELECT uploads_playlist_id, last_video_id, last_published_at, last_synced
+            FROM channel_state WHERE channel_id = ?
+        ''', (channel_id,)).fetchone()
+        if not row:
+            return None
+        return {
+            'uploads_playlist_id': row[0],
+            'last_video_id': row[1],
+            'last_published_at': row[2],
+            'last_synced': row[3],
+        }
+
+    def update_channel_state(self, channel_id, uploads_playlist_id, last_video_id=None, last_published_at=None):
+        """
+        Store the uploads playlist ID and advance the high-water mark.
+        The mark only moves forward; passing None keeps the current one.
+        """
         now = datetime.datetime.now()
-        
-        cursor.execute('''
-            INSERT INTO videos (video_id, title, artist, view_count, last_updated)
+        self._get_connection().execute('''
+            INSERT INTO channel_state (channel_id, uploads_playlist_id, last_video_id, last_published_at, last_synced)
             VALUES (?, ?, ?, ?, ?)
-            ON CONFLICT(video_id) DO UPDATE SET
-                view_count = excluded.view_count,
-                last_updated = excluded.last_updated,
-                title = excluded.title
-        ''', (video_id, title, artist, view_count, now))
-        
-        conn.commit()
-        conn.close()
+            ON CONFLICT(channel_id) DO UPDATE SET
+                uploads_playlist_id = excluded.uploads_playlist_id,
+                last_synced = excluded.last_synced,
+                last_video_id = CASE
+                    WHEN excluded.last_published_at > IFNULL(channel_state.last_published_at, '')
+                    THEN excluded.last_video_id ELSE channel_state.last_video_id END,
+                last_published_at = MAX(IFNULL(excluded.last_published_at, ''), IFNULL(channel_state.last_published_at, ''))
+        ''', (channel_id, uploads_playlist_id, last_video_id, last_published_at, now))
+        self._commit()
+
+    def get_quota_usage(self, day):
+        """Return {call_type: units} used on a quota day."""
+        rows = self._get_connection().execute(
+            'SELECT call_type, units FROM api_quota_usage WHERE day = ?', (day,)
+        ).fetchall()
+        return dict(rows)
+
+    def add_quota_usage(self, day, call_type, units):
+        """Add units to the usage counter of a quota day."""
+        self._get_connection().execute('''
+            INSERT INTO api_quota_usage (day, call_type, units) VALUES (?, ?, ?)
+            ON CONFLICT(day, call_type) DO UPDATE SET units = units + excluded.units
+        ''', (day, call_type, units))
+        self._commit()
+
+    def enqueue_post(self, account_id, video_id, action_type, milestone_value, message, now=None):
+        """
+        Queue a post for the account's dispatcher. A milestone is queued at
+        most once; returns False if it already was. A post that failed
+        earlier is queued again (mark_post_failed() forgot its history row,
+        so the milestone was detected again).
+        """
+        now = now if now is not None else time.time()
+        cursor = self._get_connection().execute('''
+            INSERT INTO post_outbox
+                (account_id, video_id, action_type, milestone_value, message, next_attempt_at, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (video_id, action_type, milestone_value) DO UPDATE SET
+                account_id = excluded.account_id, message = excluded.message,
+                status = 'pending', attempts = 0, last_error = NULL,
+                next_attempt_at = excluded.next_attempt_at
+            WHERE post_outbox.status = 'failed'
+        ''', (account_id, video_id, action_type, milestone_value, message, now, now))
+        self._commit()
+        return cursor.rowcount > 0
+
+    def get_due_posts(self, account_id, now=None, limit=10):
+        """Pending posts of an account whose next attempt is due, oldest first."""
+        now = now if now is not None else time.time()
+        rows = self._get_connection().execute('''
+            SELECT id, video_id, action_type, milestone_value, message, attempts
+            FROM post_outbox
+            WHERE status = 'pending' AND account_id = ? AND next_attempt_at <= ?
+            ORDER BY next_attempt_at, id
+            LIMIT ?
+        ''', (account_id, now, limit)).fetchall()
+        return [
+            {'id': r[0], 'video_id': r[1], 'action_type': r[2],
+             'milestone_value': r[3], 'message': r[4], 'attempts': r[5]}
+            for r in rows
+        ]
+
+    def next_post_attempt(self, account_id):
+        """Earliest next_attempt_at of the account's pending posts, or None."""
+        return self._get_connection().execute('''
+            SELECT MIN(next_attempt_at) FROM post_outbox
+            WHERE status = 'pending' AND account_id = ?
+        ''', (account_id,)).fetchone()[0]
+
+    def get_outbox_accounts(self):
+        """Accounts that have pending posts (e.g. left over from the last run)."""
+        rows = self._get_connection().execute(
+            "SELECT DISTINCT account_id FROM post_outbox WHERE status = 'pending'"
+        ).fetchall()
+        return [r[0] for r in rows]
+
+    def mark_post_sent(self, post_id, tweet_id=None, now=None):
+        self._get_connection().execute('''
+            UPDATE post_outbox SET status = 'sent', attempts = attempts + 1,
+                tweet_id = ?, sent_at = ?, last_error = NULL
+            WHERE id = ?
+        ''', (tweet_id, now if now is not None else time.time(), post_id))
+        self._commit()
+
+    def mark_post_retry(self, post_id, error, next_attempt_at):
+        self._get_connection().execute('''
+            UPDATE post_outbox SET attempts = attempts + 1, last_error = ?, next_attempt_at = ?
+            WHERE id = ?
+        ''', (str(error), next_attempt_at, post_id))
+        self._commit()
+
+    def mark_post_failed(self, post_id, error):
+        """
+        Give up on a post (permanent error or too many attempts). Its
+        post_history row is deleted in the same commit, so the next run
+        detects the milestone again and re-queues it (e.g. once an expired
+        token was replaced).
+        """
+        conn = self._get_connection()
+        conn.execute('''
+            UPDATE post_outbox SET status = 'failed', attempts = attempts + 1, last_error = ?
+            WHERE id = ?
+        ''', (str(error), post_id))
+        conn.execute('''
+            DELETE FROM post_history WHERE (video_id, action_type, milestone_value) IN (
+                SELECT video_id, action_type, milestone_value FROM post_outbox WHERE id = ?
+            )
+        ''', (post_id,))
+        self._commit()
+
+    def outbox_counts(self):
+        """Return {status: number of posts} for the outbox."""
+        rows = self._get_connection().execute(
+            'SELECT status, COUNT(*) FROM post_outbox GROUP BY status'
+        ).fetchall()
+        return dict(rows)
+
+    def prune_outbox(self, sent_retention_days=7, now=None):
+        """Delete sent posts older than the retention. Returns the number of deleted rows."""
+        now = now if now is not None else time.time()
+        cursor = self._get_connection().execute(
+            "DELETE FROM post_outbox WHERE status = 'sent' AND sent_at < ?",
+            (now - sent_retention_days * 86400,)
+        )
+        self._commit()
+        return cursor.rowcount
+
+    @metrics.timed('db.compact_snapshots')
+    def compact_snapshots(self, raw_retention_hours=48, hourly_retention_days=30, now=None):
+        """
+        Downsample old snapshots so the DB stays small.
+        - newer than raw_retention_hours: every snapshot is kept
+        - up to hourly_retention_days: only the last snapshot of each hour
+        - older: only the last snapshot of each day
+        view_count is cumulative, so the last sample of a bucket is an exact
+        rollup of that bucket. Returns the number of deleted rows.
+        """
+        now = int(now if now is not None else time.time())
+        raw_cutoff = now - int(raw_retention_hours * 3600)
+        hourly_cutoff = now - int(hourly_retention_days * 86400)
+        conn = self._get_connection()
+        deleted = 0
+        for lower, upper, bucket in ((hourly_cutoff, raw_cutoff, 3600),
+                                     (0, hourly_cutoff, 86400)):
+            # Delete every row that has a newer row in the same bucket
+            cursor = conn.execute('''
+                DELETE FROM view_snapshots
+                WHERE ts >= ? AND ts < ?
+                  AND EXISTS (
+                    SELECT 1 FROM view_snapshots AS t
+                    WHERE t.video_id = view_snapshots.video_id
+                      AND t.ts > view_snapshots.ts
+                      AND t.ts / ? = view_snapshots.ts / ?
+                  )
+            ''', (lower, upper, bucket, bucket))
+            deleted += cursor.rowcount
+        self._commit()
+        return deleted
 
     def get_video(self, video_id):
+        """Return the stored StoredVideo, or None."""
+        row = self._get_connection().execute(
+            'SELECT video_id, title, artist, view_count, last_updated FROM videos WHERE video_id = ?',
+            (video_id,)
+        ).fetchone()
+        return StoredVideo(*row) if row else None
+
+    @metrics.timed('db.get_tracked_video_ids')
+    def get_tracked_video_ids(self, artist):
+        """Return the IDs of all videos stored for an artist."""
+        rows = self._get_connection().execute(
+            'SELECT video_id FROM videos WHERE artist = ?', (artist,)
+        ).fetchall()
+        return [r[0] for r in rows]
+
+    @metrics.timed('db.load_video_stats')
+    def load_video_stats(self, artist):
+        """
+        Load the stored title and view count of all an artist's videos into
+        memory. Until the next call, bulk_update_video_stats() compares
+        against this copy and skips unchanged rows.
+        """
+        rows = self._get_connection().execute(
+            'SELECT video_id, title, view_count FROM videos WHERE artist = ?', (artist,)
+        ).fetchall()
+        self._video_stats = {vid: (title, views) for vid, title, views in rows}
+        return len(self._video_stats)
+
+    @metrics.timed('db.load_history')
+    def load_history(self, video_ids):
+        """
+        Load the post_history keys of the given videos into memory (keyed
+        by video, so it does not matter which target stored them). Until
+        the next call, check_history() answers for these videos from this
+        set without touching the DB.
+        """
+        video_ids = list(dict.fromkeys(video_ids))
         conn = self._get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM videos WHERE video_id = ?', (video_id,))
-        row = cursor.fetchone()
-        conn.close()
-        return row
+        keys = set()
+        for i in range(0, len(video_ids), 500):
+            chunk = video_ids[i:i + 500]
+            keys.update(conn.execute(f'''
+                SELECT video_id, action_type, milestone_value FROM post_history
+                WHERE video_id IN ({', '.join('?' * len(chunk))})
+            ''', chunk))
+        self._history_ids = set(video_ids)
+        self._history_keys = keys
+        return len(keys)
+
+    @property
+    def loaded_history(self):
+        """The in-memory history key set from load_history(), or None."""
+        return self._history_keys
 
     def check_history(self, video_id, action_type, milestone_value):
         """Check if we have already posted about this milestone."""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
+        if self._history_keys is not None and video_id in self._history_ids:
+            return (video_id, action_type, milestone_value) in self._history_keys
+        cursor = self._get_connection().execute('''
             SELECT 1 FROM post_history 
             WHERE video_id = ? AND action_type = ? AND milestone_value = ?
         ''', (video_id, action_type, milestone_value))
-        exists = cursor.fetchone() is not None
-        conn.close()
-        return exists
+        return cursor.fetchone() is not None
 
     def add_history(self, video_id, action_type, milestone_value):
         """Record that we posted about this milestone."""
-        conn = self._get_connection()
-        cursor = conn.cursor()
         now = datetime.datetime.now()
-        cursor.execute('''
-            INSERT INTO post_history (video_id, action_type, milestone_value, posted_at)
+        # OR IGNORE: the unique index makes a repeated record a no-op
+        self._get_connection().execute('''
+            INSERT OR IGNORE INTO post_history (video_id, action_type, milestone_value, posted_at)
             VALUES (?, ?, ?, ?)
         ''', (video_id, action_type, milestone_value, now))
-        conn.commit()
-        conn.close()
+        if self._history_keys is not None:
+            self._history_keys.add((video_id, action_type, milestone_value))
+        self._commit()
 
 if __name__ == "__main__":
     # Test
     db = DatabaseManager(db_path="../db/mv_data.db")
     db.update_video_stats("test_vid", "Test MV", "Snow Man", 100)
+    db.close()
     print("DB Initialized and test run complete.")
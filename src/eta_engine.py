@@ -0,0 +1,138 @@
+"""
+Predictive milestone ETA engine.
+
+Fits a view velocity for each video from the stored view_snapshots (a row
+per view count change) and last poll times, and predicts when it will
+cross its next event: the next milestone boundary or one of the target's
+support_trigger thresholds. From that it decides when the video should be
+polled next, so videos that are about to cross get refreshed every cycle
+and stagnant ones only occasionally.
+"""
+import heapq
+import time
+
+import metrics
+
+
+class VideoForecast:
+    __slots__ = ('video_id', 'view_count', 'last_ts', 'velocity', 'next_event', 'eta_seconds', 'next_poll_ts')
+
+    def __init__(self, video_id, view_count, last_ts, velocity, next_event, eta_seconds, next_poll_ts):
+        self.video_id = video_id
+        self.view_count = view_count
+        self.last_ts = last_ts
+        self.velocity = velocity          # views per second, None if unknown
+        self.next_event = next_event      # view count of the next event to detect
+        self.eta_seconds = eta_seconds    # from last_ts, None if unknown
+        self.next_poll_ts = next_poll_ts  # unix seconds
+
+    def __repr__(self):
+        return (f"VideoForecast({self.video_id}, views={self.view_count}, "
+                f"next_event={self.next_event}, eta={self.eta_seconds}, next_poll={self.next_poll_ts})")
+
+
+def fit_velocity(snapshots):
+    """
+    Least-squares slope (views per second) over [(ts, view_count), ...].
+    Returns None when there are not enough distinct points.
+    """
+    n = len(snapshots)
+    if n < 2:
+        return None
+    t0 = snapshots[0][0]
+    mean_t = sum(ts - t0 for ts, _ in snapshots) / n
+    mean_v = sum(v for _, v in snapshots) / n
+    num = 0.0
+    den = 0.0
+    for ts, v in snapshots:
+        dt = (ts - t0) - mean_t
+        num += dt * (v - mean_v)
+        den += dt * dt
+    if den == 0:
+        return None
+    # View counts never go down for long; treat a negative fit as stagnant
+    return max(num / den, 0.0)
+
+
+class MilestoneETAEngine:
+    def __init__(self, db, min_interval_minutes=60, max_interval_hours=24,
+                 window_hours=72, safety_factor=0.5):
+        """
+        min_interval_minutes / max_interval_hours: bounds for the poll interval
+        window_hours: how much snapshot history is used to fit the velocity
+        safety_factor: poll again after this fraction of the predicted ETA
+        """
+        self.db = db
+        self.min_interval = int(min_interval_minutes * 60)
+        self.max_interval = int(max_interval_hours * 3600)
+        self.window = int(window_hours * 3600)
+        self.safety_factor = safety_factor
+
+    @classmethod
+    def from_config(cls, db, config):
+        """Build an engine from config['system']['adaptive_polling']."""
+        opts = config.get('system', {}).get('adaptive_polling', {})
+        return cls(
+            db,
+            min_interval_minutes=opts.get('min_interval_minutes', 60),
+            max_interval_hours=opts.get('max_interval_hours', 24),
+            window_hours=opts.get('window_hours', 72),
+        )
+
+    def forecast(self, video_id, snapshots, evaluator):
+        """
+        Build a VideoForecast from a video's snapshots (oldest first).
+        evaluator: the target's MilestoneEvaluator
+        """
+        if not snapshots:
+            # Never polled: poll right away
+            return VideoForecast(video_id, None, None, None, None, None, 0)
+
+        last_ts, view_count = snapshots[-1]
+        velocity = fit_velocity(snapshots)
+        event = evaluator.next_event(view_count)
+
+        if not velocity:
+            # Unknown or zero growth: wait the maximum interval (or poll now if
+            # we cannot tell yet, i.e. only one sample)
+            eta = None
+            interval = self.max_interval if velocity == 0 else self.min_interval
+        else:
+            eta = (event - view_count) / velocity
+            interval = min(max(eta * self.safety_factor, self.min_interval), self.max_interval)
+
+        return VideoForecast(video_id, view_count, last_ts, velocity, event, eta, last_ts + int(interval))
+
+    def build_queue(self, video_ids, evaluator, artist, now=None):
+        """
+        Return a heap of (next_poll_ts, video_id) for the given videos,
+        earliest (most urgent) first.
+        """
+        now = int(now if now is not None else time.time())
+        history = self.db.get_artist_snapshots(artist, since=now - self.window)
+        polls = self.db.get_artist_polls(artist)
+        queue = []
+        for vid in video_ids:
+            snapshots = history.get(vid, [])
+            if vid in polls:
+                # Snapshots only record changes: the count was unchanged up to the
+                # last poll (and over the whole window if it has no snapshot)
+                polled_at, views = polls[vid]
+                if not snapshots:
+                    snapshots = [(now - self.window, views)]
+                if polled_at > snapshots[-1][0]:
+                    snapshots = snapshots + [(polled_at, views)]
+            fc = self.forecast(vid, snapshots, evaluator)
+            queue.append((fc.next_poll_ts, vid))
+        heapq.heapify(queue)
+        return queue
+
+    @metrics.timed('eta.due_videos')
+    def due_videos(self, video_ids, evaluator, artist, now=None):
+        """Video IDs whose next poll time has come, most urgent first."""
+        now = int(now if now is not None else time.time())
+        queue = self.build_queue(video_ids, evaluator, artist, now=now)
+        due = []
+        while queue and queue[0][0] <= now:
+            due.append(heapq.heappop(queue)[1])
+        return due
@@ -1,10 +1,17 @@
-import schedule
 import time
+# (phase, perf_counter) marks for --profile-startup, in order
+STARTUP_MARKS = [("start", time.perf_counter())]
+# Components built lazily after startup (e.g. X clients, on the first post):
+# {name: ms}, timed on their own rather than as sequential phases
+LAZY_INIT_MS = {}
+import json
 import yaml
 import os
 import sys
-import random
+import signal
+import threading
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
 # Add src directory to path so imports work
@@ -14,80 +21,275 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 load_dotenv(os.path.join(base_dir, ".env"))
 
-from youtube_client import YouTubeClient
-from x_client import XClient
+from youtube_client import YouTubeClient, VideoStatsCache
 from db_manager import DatabaseManager
+from target_plan import compile_plans
+from pipeline import Pipeline, TargetFetch, TRACKED
+from eta_engine import MilestoneETAEngine
+from quota import QuotaScheduler
+from outbox import PostOutbox
+from response_cache import ResponseCache
+from state_store import StateStore
+import metrics
+import shards
+STARTUP_MARKS.append(("imports", time.perf_counter()))
+
+# --metrics-out: overrides system.metrics.export_path
+METRICS_OUT = None
+# --shards: overrides system.shards
+SHARDS = None
+
+def mark_startup(phase):
+    """Record the end of a startup phase (only the first mark of a phase counts)."""
+    if not any(name == phase for name, _ in STARTUP_MARKS):
+        STARTUP_MARKS.append((phase, time.perf_counter()))
+
+def record_lazy_init(name, started):
+    """Record how long building a lazily created component took (first build only)."""
+    LAZY_INIT_MS.setdefault(name, round((time.perf_counter() - started) * 1000, 2))
+
+def startup_report():
+    """
+    Per-phase startup timings as a dict:
+    {'phases': {phase: ms}, 'total_ms': ms, 'lazy_ms': {component: ms}}
+    """
+    phases = {}
+    for (_, prev), (name, ts) in zip(STARTUP_MARKS, STARTUP_MARKS[1:]):
+        phases[name] = round((ts - prev) * 1000, 2)
+    total = (STARTUP_MARKS[-1][1] - STARTUP_MARKS[0][1]) * 1000
+    return {'phases': phases, 'total_ms': round(total, 2), 'lazy_ms': dict(LAZY_INIT_MS)}
+
+def print_startup_report():
+    report = startup_report()
+    print("\n--- Startup profile ---")
+    for phase, ms in report['phases'].items():
+        print(f"{phase:<24}{ms:>10.2f} ms")
+    print(f"{'total':<24}{report['total_ms']:>10.2f} ms")
+    for name, ms in report['lazy_ms'].items():
+        print(f"{name:<24}{ms:>10.2f} ms (built on first use)")
+    # Single machine-readable line so CI logs can be tracked over time
+    print("STARTUP_PROFILE " + json.dumps(report, ensure_ascii=False))
 
 def load_config(path="config/config.yaml"):
     try:
         with open(path, "r", encoding="utf-8") as f:
-            return yaml.safe_load(f)
+            # The libyaml-based loader is several times faster when available
+            return yaml.load(f, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader))
     except FileNotFoundError:
         print(f"Config file not found at {path}")
         return None
 
-def format_number(num):
-    """
-    Format number in Japanese style for better impact.
-    Examples:
-        100000000 -> "1億"
-        50000000 -> "5000万"
-        1000000 -> "100万"
-        500000 -> "50万"
-        10000 -> "1万"
-        1234 -> "1,234"
-    """
-    if num >= 100000000:  # 1億以上
-        oku = num // 100000000
-        remainder = num % 100000000
-        if remainder == 0:
-            return f"{oku}億"
-        elif remainder >= 10000000:  # 1000万以上の端数
-            man = remainder // 10000
-            return f"{oku}億{man}万"
-        else:
-            return f"{oku}億"
-    elif num >= 10000:  # 1万以上
-        man = num // 10000
-        return f"{man}万"
-    else:
-        return "{:,}".format(num)
+def x_credentials(account_id):
+    """The account's X API credentials from the environment, or None if incomplete."""
+    credentials = tuple(os.getenv(f"{account_id}_TWITTER_{name}") for name in
+                        ("CONSUMER_KEY", "CONSUMER_SECRET", "ACCESS_TOKEN", "ACCESS_TOKEN_SECRET"))
+    return credentials if all(credentials) else None
 
-def create_message(template_or_list, data):
+class BotContext:
     """
-    Create a message by filling data into the template.
-    If a list of templates is provided, select one randomly.
+    Long-lived state shared by check cycles: config, DB connection, YouTube
+    client and worker pools. A one-shot run builds one and closes it at the
+    end; daemon mode keeps it warm across cycles.
     """
-    if isinstance(template_or_list, list):
-        template = random.choice(template_or_list)
-    else:
-        template = template_or_list
+    def __init__(self, base_dir):
+        self.base_dir = base_dir
+        self.config_path = os.path.join(base_dir, "config", "config.yaml")
+        self.db_path = os.path.join(base_dir, "db", "mv_data.db")
+        self.config = None
+        self.config_mtime = None
+        self.db = None
+        self.state_store = None
+        self.yt_client = None
+        self.eta_engine = None
+        self.plans = []
+        self.workers = 1
+        self.target_pool = None
+        self.batch_pool = None
+        self.shards = 1
+        self.shard_pool = None
+        self.outbox = None
+        self.drained = False  # the last cycle already waited for the outbox
+        self.x_clients = None
+        self._x_clients_lock = threading.Lock()
+
+    @classmethod
+    def create(cls, base_dir):
+        """Build a ready context, or return None (after printing why) on failure."""
+        ctx = cls(base_dir)
+        if not ctx.load_config():
+            print("Failed to load config. Exiting.")
+            return None
+        mark_startup("config")
         
-    msg = template
-    for key, value in data.items():
-        msg = msg.replace("{" + key + "}", str(value))
-    return msg
+        # Initialize YouTube client
+        youtube_api_key = os.getenv("YOUTUBE_API_KEY")
+        if not youtube_api_key:
+            print("YOUTUBE_API_KEY not found in environment. Exiting.")
+            return None
+        transport = ctx.config.get('system', {}).get('youtube_transport', {})
+        ctx.yt_client = YouTubeClient(
+            youtube_api_key,
+            pooled=transport.get('pooled', True),
+            batch_requests=transport.get('batch_requests', True)
+        )
+        # ETag cache for playlist pages and channels.list (kept under .cache/)
+        ctx.yt_client.response_cache = ResponseCache.from_config(ctx.config)
+        mark_startup("youtube_client")
+        
+        # Rebuild the DB from the snapshot/delta files in git when it is missing or stale
+        ctx.state_store = StateStore.from_config(base_dir, ctx.config)
+        if ctx.state_store:
+            started = time.perf_counter()
+            rows = ctx.state_store.restore(ctx.db_path)
+            if rows is not None:
+                print(f"DB restored from the state store: {rows} rows in {time.perf_counter() - started:.2f}s")
+            mark_startup("db_restore")
+        
+        # Initialize Database
+        ctx.db = DatabaseManager(ctx.db_path)
+        mark_startup("db")
+        ctx.apply_config()
+        mark_startup("context_ready")
+        return ctx
 
+    def _config_file_mtime(self):
+        try:
+            return os.stat(self.config_path).st_mtime
+        except OSError:
+            return None
 
+    def load_config(self):
+        config = load_config(self.config_path)
+        if not config:
+            return False
+        self.config = config
+        self.config_mtime = self._config_file_mtime()
+        return True
 
-def get_milestone_step(view_count, milestones_config):
-    """
-    Determine the appropriate step (increment) based on current view count and rules.
-    """
-    rules = milestones_config.get('dynamic_rules', [])
-    # If no dynamic rules, fallback to static 'step'
-    if not rules:
-        return milestones_config.get('step', 1000000)
-    
-    # Check rules (assuming they are sorted desc or we just find first match > threshold)
-    # The config has them listed. We should iterate.
-    for rule in rules:
-        if view_count >= rule['threshold']:
-            return rule['step']
-    
-    return milestones_config.get('step', 1000000)
+    def reload_config_if_changed(self):
+        """Hot reload: re-read the config when the file changed. Returns True if reloaded."""
+        mtime = self._config_file_mtime()
+        if mtime is None or mtime == self.config_mtime:
+            return False
+        if not self.load_config():
+            # Keep running with the previous config
+            print("Config reload failed; keeping the previous config.")
+            self.config_mtime = mtime
+            return False
+        self.apply_config()
+        print("Config reloaded.")
+        return True
+
+    def apply_config(self):
+        """(Re)build the parts that depend on the config."""
+        system = self.config.get('system', {})
+        
+        # DEBUG prints every timing span, WARNING and above hide the run summary
+        metrics.configure(system.get('log_level', 'INFO'))
+        
+        # Filters, step rules and static template parts, compiled once per config
+        self.plans = compile_plans(self.config)
+        
+        # Predictive poll scheduling for the tracked-videos refresh
+        self.eta_engine = None
+        if system.get('adaptive_polling', {}).get('enabled', False):
+            self.eta_engine = MilestoneETAEngine.from_config(self.db, self.config)
+        
+        # Background X posting; dispatchers keep running across config reloads
+        if self.outbox:
+            self.outbox.configure(self.config)
+        else:
+            self.outbox = PostOutbox.from_config(self.db_path, self.config, self.get_x_client)
+        
+        # Concurrent mode: fetch targets (and stats batches) in worker threads.
+        # Evaluation, DB writes and posts still happen one target at a time.
+        workers = max(int(system.get('workers', 1)), 1)
+        if workers != self.workers or (workers > 1 and not self.target_pool):
+            self._shutdown_pools()
+            self.workers = workers
+            if workers > 1:
+                self.target_pool = ThreadPoolExecutor(max_workers=workers)
+                self.batch_pool = ThreadPoolExecutor(max_workers=workers)
+        
+        # Sharded mode: fetch shards of targets in worker processes (see shards.py)
+        shard_count = max(int(SHARDS or system.get('shards', 1)), 1)
+        if shard_count != self.shards:
+            self._shutdown_shard_pool()
+            self.shards = shard_count
+            if shard_count > 1:
+                self.shard_pool = shards.create_pool(shard_count)
+
+    def get_x_client(self, account_id):
+        """
+        The account's XClient from the per-process pool (built on first use;
+        called from the outbox dispatcher threads).
+        """
+        with self._x_clients_lock:
+            if self.x_clients is None:
+                started = time.perf_counter()
+                # Imported here so runs without credentials never load tweepy
+                from x_client import XClientPool
+                # X_API_HOST points the clients at another endpoint (e.g. a local fake X API)
+                self.x_clients = XClientPool(x_credentials, api_host=os.getenv("X_API_HOST"))
+                record_lazy_init("x_client_pool", started)
+        started = time.perf_counter()
+        known = account_id in self.x_clients.clients
+        client = self.x_clients.get(account_id)
+        if not known:
+            record_lazy_init(f"x_client:{account_id}", started)
+        return client
 
-def check_and_post(full_scan=False, init_mode=False):
+    def _shutdown_pools(self):
+        if self.target_pool:
+            self.target_pool.shutdown()
+            self.batch_pool.shutdown()
+        self.target_pool = None
+        self.batch_pool = None
+
+    def _shutdown_shard_pool(self):
+        if self.shard_pool:
+            self.shard_pool.shutdown()
+        self.shard_pool = None
+
+    def export_state(self):
+        """Checkpoint the DB and write what changed to the state store (if enabled)."""
+        if not self.state_store:
+            self.db.checkpoint()
+            return
+        started = time.perf_counter()
+        try:
+            result = self.db.export_state(self.state_store)
+        except Exception as e:
+            # The DB itself is intact; the next export diffs against the same baseline
+            print(f"State export failed: {e}")
+            return
+        print(f"State exported ({result}) in {time.perf_counter() - started:.2f}s")
+
+    @property
+    def drain_timeout(self):
+        return self.config.get('system', {}).get('x_posting', {}).get('drain_timeout_seconds', 120)
+
+    def close(self):
+        if self.outbox:
+            # Give queued posts a chance to go out (unless the cycle just
+            # waited for them); the rest stays in the outbox
+            self.outbox.close(0 if self.drained else self.drain_timeout)
+            self.outbox = None
+        if self.x_clients:
+            self.x_clients.close()
+            self.x_clients = None
+        self._shutdown_pools()
+        self._shutdown_shard_pool()
+        if self.yt_client:
+            self.yt_client.close()
+            if self.yt_client.response_cache:
+                self.yt_client.response_cache.close()
+        if self.db:
+            self.export_state()
+            self.db.close()
+            self.db = None
+
+def check_and_post(full_scan=False, init_mode=False, ctx=None):
     """
     Main function to check YouTube videos and post to X when milestones are reached.
     
@@ -95,15 +297,30 @@ def check_and_post(full_scan=False, init_mode=False):
         full_scan: If True, scan all videos (not just recent 50)
         init_mode: If True, skip posting and just update DB with current milestones
                    (for initial setup - no posts, no limit, just record current state)
+        ctx: BotContext to reuse (daemon mode). If None, one is built for this
+             run and closed at the end.
     """
-    # Load configuration
-    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    config_path = os.path.join(base_dir, "config", "config.yaml")
-    config = load_config(config_path)
+    if ctx is not None:
+        return _check_cycle(ctx, full_scan, init_mode)
     
-    if not config:
-        print("Failed to load config. Exiting.")
-        return
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    ctx = BotContext.create(base_dir)
+    if not ctx:
+        return False
+    try:
+        return _check_cycle(ctx, full_scan, init_mode)
+    finally:
+        ctx.close()
+
+def _check_cycle(ctx, full_scan, init_mode):
+    # Spans and counters are per cycle
+    metrics.reset()
+    ctx.drained = False
+    config = ctx.config
+    db = ctx.db
+    yt_client = ctx.yt_client
+    eta_engine = ctx.eta_engine
+    target_pool = ctx.target_pool
     
     # In init mode, disable post limit and skip actual posting
     if init_mode:
@@ -114,316 +331,227 @@ def check_and_post(full_scan=False, init_mode=False):
         print("="*60)
     else:
         max_posts = config.get('system', {}).get('max_posts_per_run', 3)
-    post_count = 0  # Track number of posts made
+    # filter -> persist -> evaluate -> render -> dispatch; tracks the posts made
+    pipeline = Pipeline(db, init_mode, max_posts)
     
-    # Initialize YouTube client
-    youtube_api_key = os.getenv("YOUTUBE_API_KEY")
-    if not youtube_api_key:
-        print("YOUTUBE_API_KEY not found in environment. Exiting.")
-        return
+    # Every API call is charged against the daily quota (persisted in the DB).
+    # The scheduler is per cycle: it re-reads today's usage from the DB.
+    quota = QuotaScheduler.from_config(db, config)
+    yt_client.quota = quota
+    # Per-run videos.list cache: each video's stats are fetched at most once
+    stats_cache = VideoStatsCache(yt_client, executor=ctx.batch_pool)
     
-    yt_client = YouTubeClient(youtube_api_key)
+    # Targets with a higher 'priority' go first and get a larger share of the budget
+    plans = ctx.plans
+    quota.plan([plan.target for plan in plans])
+    print(quota.summary())
     
-    # Initialize Database
-    db_path = os.path.join(base_dir, "db", "mv_data.db")
-    db = DatabaseManager(db_path)
+    # Posts left in the outbox by earlier runs
+    if not init_mode:
+        ctx.outbox.resume([a for a in db.get_outbox_accounts() if x_credentials(a)])
     
-    # Process each target
-    for target in config.get('targets', []):
-        artist_name = target['artist_name']
-        account_id = target.get('account_id', 'DEFAULT')
-        channel_id = target['channel_id']
-        hashtags = " ".join(target.get('hashtags', []))
-        title_keywords = target.get('title_keywords', [])
-        exclude_keywords = target.get('exclude_keywords', [])  # 除外キーワード
-        
-        # Custom variables for templates
-        custom_vars = target.get('custom_vars', {})
-        custom_vars.setdefault('fan_name', 'ファン')
-        custom_vars.setdefault('oshi_mark', '✨')
-        custom_vars.setdefault('cheer_msg', f"{artist_name}最高！")
-        
-        print(f"\n{'='*60}")
-        print(f"Processing: {artist_name} (Account: {account_id})")
-        print(f"{'='*60}")
-        
-        # Initialize X client for this account (if credentials exist)
-        x_client = None
-        consumer_key = os.getenv(f"{account_id}_TWITTER_CONSUMER_KEY")
-        consumer_secret = os.getenv(f"{account_id}_TWITTER_CONSUMER_SECRET")
-        access_token = os.getenv(f"{account_id}_TWITTER_ACCESS_TOKEN")
-        access_token_secret = os.getenv(f"{account_id}_TWITTER_ACCESS_TOKEN_SECRET")
-        
-        if all([consumer_key, consumer_secret, access_token, access_token_secret]):
-            x_client = XClient(consumer_key, consumer_secret, access_token, access_token_secret)
-            print("X client initialized successfully.")
-        else:
-            print("X credentials not found. Running in simulation mode.")
-        
-        # Fetch videos from channel
-        videos = yt_client.get_channel_videos(channel_id, limit=50, full_scan=full_scan)
-        print(f"Fetched {len(videos)} videos from channel.")
-        
-        videos_processed = 0
-        top_video_info = None
-        
-        for video in videos:
-            vid = video['id']
-            title = video['title']
-            view_count = video.get('view_count', 0)
-            duration_seconds = video.get('duration_seconds', 0)
-            video_url = f"https://www.youtube.com/watch?v={vid}"
-            
-            # Filter by title keywords if specified
-            if title_keywords:
-                if not any(kw.lower() in title.lower() for kw in title_keywords):
-                    continue
-            
-            # Exclude videos matching exclude_keywords (e.g. 鑑賞会)
-            if exclude_keywords:
-                if any(kw.lower() in title.lower() for kw in exclude_keywords):
-                    continue
-            
-            # Filter out shorts (less than 60 seconds typically)
-            if duration_seconds < 60:
-                continue
-            
-            videos_processed += 1
-            
-            # Update database
-            db.update_video_stats(vid, title, artist_name, view_count)
-            
-            # Milestones logic
-            milestone_step = get_milestone_step(view_count, target['milestones'])
-            current_views = view_count
-            
-            # Debug info for top video
-            if not top_video_info or current_views > top_video_info['views']:
-                top_video_info = {'title': title, 'views': current_views}
-            
-            # --- Check Achievement (e.g. passed 1M, 2M...) ---
-            # Calculation logic needs care.
-            # Example: 105M views. Rules: >100M step 100M.
-            # We want to know if it passed 100M recently.
-            # achieved = (105M // 100M) * 100M = 100M.
-            
-            # Edge case: Transitioning rules?
-            # If 9.9M -> step 1M. Next target 10M.
-            # If 10.1M -> step 10M. Achieved 10M.
-            # It works naturally.
-            
-            achieved_milestone = (current_views // milestone_step) * milestone_step
-            
-            if achieved_milestone >= target['milestones']['initial_target']:
-                # Check if we already posted about this milestone
-                if not db.check_history(vid, 'achieved', achieved_milestone):
-                    # Check post limit
-                    if post_count >= max_posts:
-                        print(f"[SKIPPED] Post limit reached ({max_posts}). Skipping: {title}")
-                    else:
-                        # In init mode, just record to DB silently
-                        if init_mode:
-                            db.add_history(vid, 'achieved', achieved_milestone)
-                            post_count += 1
-                        else:
-                            # Next goal calc
-                            next_goal_val = achieved_milestone + milestone_step
-                            
-                            # Prepare Data
-                            data = {
-                                "artist_name": artist_name,
-                                "video_title": title,
-                                "views": format_number(achieved_milestone),
-                                "next_goal": format_number(next_goal_val),
-                                "video_url": video_url,
-                                "hashtags": hashtags,
-                                **custom_vars
-                            }
-                            msg = create_message(config['templates']['achieved'], data)
-                            
-                            print(f"\n[POST REQUEST] !!! ACHIEVEMENT UNLOCKED !!!")
-                            print(f"Video: {title} passed {format_number(achieved_milestone)} views")
-                            print("---------------------------------------------------")
-                            print(msg)
-                            print("---------------------------------------------------")
-                            
-                            if x_client:
-                                success = x_client.post_tweet(msg)
-                                if success:
-                                    db.add_history(vid, 'achieved', achieved_milestone)
-                                    post_count += 1
-                            else:
-                                db.add_history(vid, 'achieved', achieved_milestone)
-                                post_count += 1
-                                print("(Simulated post saved to DB)")
-
-            # --- Check Support (Approaching milestone) ---
-            next_milestone = achieved_milestone + milestone_step
-            remaining = next_milestone - current_views
-            
-            # Sort triggers by remaining ASC (check most urgent first: 10k before 100k)
-            sorted_triggers = sorted(target['support_trigger'], key=lambda x: x['remaining'])
-            
-            for trigger in sorted_triggers:
-                trigger_val = trigger['remaining']
-                
-                if 0 < remaining <= trigger_val:
-                    action_type = f"support_{trigger_val}"
-                    
-                    if not db.check_history(vid, action_type, next_milestone):
-                        # In init mode, just record to DB silently
-                        if init_mode:
-                            db.add_history(vid, action_type, next_milestone)
-                            # Don't count support in post_count for init mode summary
-                        else:
-                            # Check post limit
-                            if post_count >= max_posts:
-                                print(f"[SKIPPED] Post limit reached ({max_posts}). Skipping support: {title}")
-                                break
-                            
-                            data = {
-                                "artist_name": artist_name,
-                                "video_title": title,
-                                "target_views": format_number(next_milestone),
-                                "current_views": format_number(current_views),
-                                "remaining": format_number(remaining),
-                                "video_url": video_url,
-                                "hashtags": hashtags,
-                                **custom_vars
-                            }
-                            msg = create_message(config['templates']['support'], data)
-                            
-                            print(f"\n[POST REQUEST] !!! SUPPORT NEEDED ({trigger_val}) !!!")
-                            print(f"Video: {title} is attached to {format_number(next_milestone)}")
-                            print("---------------------------------------------------")
-                            print(msg)
-                            print("---------------------------------------------------")
-                            
-                            if x_client:
-                                success = x_client.post_tweet(msg)
-                                if success:
-                                    db.add_history(vid, action_type, next_milestone)
-                                    post_count += 1
-                            else:
-                                db.add_history(vid, action_type, next_milestone)
-                                post_count += 1
-                                print("(Simulated post saved to DB)")
-                        
-                        break 
-        
-        if init_mode:
-            print(f"✅ Recorded {post_count} milestone achievements to DB for {artist_name}")
-        else:
-            print(f"Processed {videos_processed} relevant videos (Filtered from {len(videos)} fetch results).")
+    # Read what each target's fetch needs from the DB up front (only this
+    # thread uses the DB), then start the fetches
+    jobs = []
+    for plan in plans:
+        artist_name = plan.artist_name
+        channel_state = db.get_channel_state(plan.channel_id) or {}
         
-        # --- 2. Update Stats for ALL Existing Videos in DB for THIS target ---
+        # Tracked videos to refresh as the last batch (stats for ALL existing videos in DB).
         # Skip this in init mode (we already did a full scan)
-        # This ensures we track old MVs even if they are not in the latest 50 uploads.
+        # This ensures we track old MVs even if they are not in the latest uploads.
+        tracked_ids = []
         if not full_scan and not init_mode:
-            print(f"\nUpdating stats for tracked videos of {artist_name} in DB...")
             # Get all video IDs from DB for this artist
-            conn = db._get_connection()
-            tracked_videos = conn.execute(
-                "SELECT video_id FROM videos WHERE artist = ?", (artist_name,)
-            ).fetchall()
-            conn.close()
-            tracked_ids = [r[0] for r in tracked_videos]
+            tracked_ids = db.get_tracked_video_ids(artist_name)
             
-            # Process in chunks of 50 (API limit)
-            for i in range(0, len(tracked_ids), 50):
-                chunk_ids = tracked_ids[i:i+50]
-                if not chunk_ids:
-                    continue
-                    
-                stats_request = yt_client.youtube.videos().list(
-                    part='statistics,snippet,contentDetails',
-                    id=','.join(chunk_ids)
-                )
-                stats_response = stats_request.execute()
-                
-                for item in stats_response.get('items', []):
-                    vid = item['id']
-                    title = item['snippet']['title']
-                    view_count = int(item['statistics'].get('viewCount', 0))
-                    
-                    # Update DB
-                    db.update_video_stats(vid, title, artist_name, view_count)
+            # Only refresh videos the ETA engine considers due (near a milestone
+            # or not polled for a while)
+            if eta_engine:
+                due_ids = eta_engine.due_videos(tracked_ids, plan.evaluator, artist_name)
+                print(f"Adaptive polling ({artist_name}): {len(due_ids)}/{len(tracked_ids)} tracked videos due.")
+                tracked_ids = due_ids
+        
+        jobs.append((plan, channel_state, tracked_ids))
+    
+    if ctx.shard_pool:
+        # Fetched shard by shard in worker processes; this process stays the
+        # only DB writer and posts within one budget
+        fetches = shards.start(ctx.shard_pool, ctx.shards, config, jobs, quota, full_scan)
+    else:
+        fetches = []
+        for plan, channel_state, tracked_ids in jobs:
+            fetch = TargetFetch(plan, yt_client, stats_cache, channel_state, tracked_ids, full_scan)
+            if target_pool:
+                fetch.start(target_pool)
+            fetches.append(fetch)
+    
+    # Process each target
+    try:
+        for fetch in fetches:
+            _process_target(ctx, pipeline, fetch.plan, fetch, quota, init_mode)
+    finally:
+        # Unblock fetch workers of targets that were not processed
+        for fetch in fetches:
+            fetch.cancel()
+        # Usage not flushed per target (a skipped target, an error) still counts
+        quota.flush()
 
-                    # Milestones logic
-                    milestone_step = get_milestone_step(view_count, target['milestones'])
-                    current_views = view_count
-                    
-                    achieved_milestone = (current_views // milestone_step) * milestone_step
+    # Wait for the cycle's posts first, so their spans and counters are
+    # part of this run's metrics (posts still waiting on the rate limit
+    # afterwards count toward the next run)
+    if ctx.outbox and not init_mode and ctx.drain_timeout:
+        if not ctx.outbox.drain(ctx.drain_timeout):
+            print("Outbox: timed out waiting for posts; they are sent in the background.")
+        ctx.drained = True
+    
+    # Downsample old view count history so the committed DB stays small
+    retention = config.get('system', {}).get('snapshot_retention', {})
+    removed = db.compact_snapshots(
+        raw_retention_hours=retention.get('raw_hours', 48),
+        hourly_retention_days=retention.get('hourly_days', 30)
+    )
+    if removed:
+        print(f"Compacted {removed} old view snapshots.")
+    db.prune_outbox()
+    
+    counts = db.outbox_counts()
+    if counts:
+        print("Outbox: " + ", ".join(f"{status}={n}" for status, n in sorted(counts.items())))
+    
+    print(pipeline.timings.summary())
+    print(f"Video rows: {pipeline.rows_changed} changed, {pipeline.rows_unchanged} unchanged (not rewritten).")
+    print(quota.summary())
+    if yt_client.response_cache:
+        print(yt_client.response_cache.summary())
+    metrics.print_summary()
+    metrics_path = METRICS_OUT or config.get('system', {}).get('metrics', {}).get('export_path')
+    if metrics_path:
+        mode = 'init' if init_mode else 'full' if full_scan else 'normal'
+        metrics.export(os.path.join(ctx.base_dir, metrics_path), mode=mode)
+    print("Check cycle complete.")
+    return True
 
-                    if achieved_milestone >= target['milestones']['initial_target']:
-                        if not db.check_history(vid, 'achieved', achieved_milestone):
-                            # Check post limit
-                            if post_count >= max_posts:
-                                print(f"[SKIPPED] Post limit reached ({max_posts}). Skipping: {title}")
-                            else:
-                                # Next goal calc
-                                next_goal_val = achieved_milestone + milestone_step
-                                
-                                data = {
-                                    "artist_name": artist_name,
-                                    "video_title": title,
-                                    "views": format_number(achieved_milestone),
-                                    "next_goal": format_number(next_goal_val),
-                                    "video_url": f"https://www.youtube.com/watch?v={vid}",
-                                    "hashtags": hashtags,
-                                    **custom_vars
-                                }
-                                msg = create_message(config['templates']['achieved'], data)
-                                print(f"\n[POST] Achievement: {title} ({format_number(achieved_milestone)})")
-                                if x_client:
-                                    if x_client.post_tweet(msg):
-                                        db.add_history(vid, 'achieved', achieved_milestone)
-                                        post_count += 1
-                                else:
-                                    db.add_history(vid, 'achieved', achieved_milestone)
-                                    post_count += 1
-                    
-                    # Check Support
-                    next_milestone = achieved_milestone + milestone_step
-                    remaining = next_milestone - current_views
-                    
-                    # Sort triggers by remaining ASC (check most urgent first: 10k before 100k)
-                    sorted_triggers = sorted(target['support_trigger'], key=lambda x: x['remaining'])
-                    
-                    for trigger in sorted_triggers:
-                        trigger_val = trigger['remaining']
-                        if 0 < remaining <= trigger_val:
-                            action_type = f"support_{trigger_val}"
-                            
-                            if not db.check_history(vid, action_type, next_milestone):
-                                # Check post limit
-                                if post_count >= max_posts:
-                                    print(f"[SKIPPED] Post limit reached ({max_posts}). Skipping support: {title}")
-                                    break
-                                
-                                data = {
-                                    "artist_name": artist_name,
-                                    "video_title": title,
-                                    "target_views": format_number(next_milestone),
-                                    "current_views": format_number(current_views),
-                                    "remaining": format_number(remaining),
-                                    "video_url": f"https://www.youtube.com/watch?v={vid}",
-                                    "hashtags": hashtags,
-                                    **custom_vars
-                                }
-                                msg = create_message(config['templates']['support'], data)
-                                print(f"\n[POST] Support ({trigger_val}): {title} (Rem: {remaining})")
-                                if x_client:
-                                    if x_client.post_tweet(msg):
-                                        db.add_history(vid, action_type, next_milestone)
-                                        post_count += 1
-                                else:
-                                    db.add_history(vid, action_type, next_milestone)
-                                    post_count += 1
-                            
-                            break
+def _process_target(ctx, pipeline, plan, fetch, quota, init_mode):
+    """
+    Run one target's batches through the pipeline as they arrive from its
+    TargetFetch, one DB transaction per batch.
+    """
+    db = ctx.db
+    artist_name = plan.artist_name
+    account_id = plan.account_id
+    channel_id = plan.channel_id
+    
+    print(f"\n{'='*60}")
+    print(f"Processing: {artist_name} (Account: {account_id})")
+    print(f"{'='*60}")
+    
+    # Posts of accounts with X credentials go through the outbox
+    outbox = None
+    if init_mode:
+        pass  # Init mode never posts
+    elif x_credentials(account_id):
+        outbox = ctx.outbox
+        print("X credentials found. Posts are queued and sent in the background.")
+    else:
+        print("X credentials not found. Running in simulation mode.")
+    pipeline.begin_target(plan, outbox)
+    
+    videos_processed = 0
+    
+    # Only videos whose stats changed are written back
+    db.load_video_stats(artist_name)
+    
+    # Each page of uploads is stored, evaluated and posted while the next
+    # one is fetched; the tracked videos follow as the last batch
+    for batch in pipeline.fetch(fetch):
+        if batch.source == TRACKED:
+            print(f"\nUpdating stats for {len(fetch.tracked_ids)} tracked videos of {artist_name} in DB...")
+            if fetch.quota_skipped:
+                print(f"[SKIPPED] Quota budget exhausted. Skipping refresh of {fetch.quota_skipped} tracked videos.")
+        # One unit of work per batch, committed before the next page is
+        # awaited: the write lock is never held across API calls (the
+        # outbox dispatchers write to the same DB)
+        with db.transaction():
+            pipeline.process(batch)
+        if batch.source != TRACKED:
+            videos_processed += len(batch.videos)
+        # The batch's posts are committed: let the dispatcher send them
+        if outbox and batch.events:
+            outbox.wake(account_id)
+    
+    if fetch.uploads_playlist_id is None:
+        return
+    
+    newest = fetch.newest
+    db.update_channel_state(
+        channel_id, fetch.uploads_playlist_id,
+        newest.id if newest else None,
+        newest.published_at if newest else None
+    )
+    
+    if init_mode:
+        print(f"✅ Recorded {pipeline.post_count} milestone achievements to DB for {artist_name}")
+    else:
+        print(f"Processed {videos_processed} relevant videos (Filtered from {fetch.fetched} fetch results).")
+    
+    # Quota usage is buffered by the scheduler; only this thread writes it
+    quota.flush()
 
-    print("Check cycle complete.")
+def run_daemon(full_scan=False):
+    """
+    Long-running mode: run a check cycle every system.check_interval_minutes,
+    keeping config, clients, the DB connection and caches warm between cycles.
+    The config file is hot-reloaded when it changes; SIGTERM/SIGINT stop the
+    loop after the current cycle and close everything cleanly.
+    """
+    import schedule  # only the daemon needs it
+    
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    ctx = BotContext.create(base_dir)
+    if not ctx:
+        return False
+    
+    stop = {'requested': False}
+    
+    def request_stop(signum, frame):
+        print(f"Received signal {signum}. Shutting down after the current cycle...")
+        stop['requested'] = True
+    
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+    
+    def run_cycle():
+        started = time.perf_counter()
+        try:
+            check_and_post(full_scan=full_scan, ctx=ctx)
+        except Exception as e:
+            # Keep the daemon alive; the next cycle retries
+            print(f"Check cycle failed: {e}")
+        # Make the DB file self-contained between cycles (and export it)
+        ctx.export_state()
+        print(f"Cycle finished in {time.perf_counter() - started:.2f}s. Next run in {interval} minutes.")
+    
+    def schedule_cycles():
+        schedule.clear()
+        minutes = max(int(ctx.config.get('system', {}).get('check_interval_minutes', 60)), 1)
+        schedule.every(minutes).minutes.do(run_cycle)
+        return minutes
+    
+    interval = schedule_cycles()
+    print(f"Daemon started. Checking every {interval} minutes.")
+    try:
+        run_cycle()
+        while not stop['requested']:
+            if ctx.reload_config_if_changed():
+                interval = schedule_cycles()
+            schedule.run_pending()
+            time.sleep(1)
+    finally:
+        schedule.clear()
+        ctx.close()
+        print("Daemon stopped.")
+    return True
 
 if __name__ == "__main__":
     # GitHub Actions Execution Mode
@@ -436,7 +564,41 @@ if __name__ == "__main__":
     parser.add_argument("--full-scan", action="store_true", help="Perform full scan of channel")
     parser.add_argument("--init", action="store_true", 
                         help="Initialize DB with current milestone state (no posting, just record)")
+    parser.add_argument("--daemon", action="store_true",
+                        help="Keep running and check every system.check_interval_minutes")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="Print per-phase startup timings (imports, config, clients, DB)")
+    parser.add_argument("--metrics-out", metavar="PATH",
+                        help="Export each run's metrics to PATH (.jsonl: JSON lines, otherwise Prometheus text)")
+    parser.add_argument("--profile-sample", metavar="PATH",
+                        help="Run the sampling profiler and write collapsed stacks to PATH")
+    parser.add_argument("--profile-interval", type=float, default=5, metavar="MS",
+                        help="Sampling interval of --profile-sample in milliseconds (default: 5)")
+    parser.add_argument("--shards", type=int, metavar="N",
+                        help="Fetch targets in N worker processes (overrides system.shards)")
     args = parser.parse_args()
+    METRICS_OUT = args.metrics_out
+    SHARDS = args.shards
+    
+    profiler = None
+    if args.profile_sample:
+        profiler = metrics.SamplingProfiler(interval=args.profile_interval / 1000)
+        profiler.start()
+    
+    try:
+        if args.daemon:
+            run_daemon(full_scan=args.full_scan)
+        else:
+            check_and_post(full_scan=args.full_scan or args.init, init_mode=args.init)
+    finally:
+        if profiler:
+            profiler.stop()
+            profiler.write(args.profile_sample)
+            print(f"\n--- Sampling profile ({profiler.samples} samples, main thread self time) ---")
+            for frame, samples in profiler.top():
+                print(f"{samples:>7}  {frame}")
+            print(f"Collapsed stacks written to {args.profile_sample}")
     
-    check_and_post(full_scan=args.full_scan or args.init, init_mode=args.init)
+    if args.profile_startup:
+        print_startup_report()
 
@@ -0,0 +1,250 @@
+"""
+Run metrics: timing spans and counters on the hot paths, exported per run.
+
+    with metrics.span('youtube.videos.list'):
+        ...
+    metrics.incr('youtube_quota_units', units)
+
+Spans keep count / total / max seconds per name. Counters keep one number
+per name. Both live in one process-wide registry shared by all threads.
+A check cycle resets the registry when it starts, prints a summary when
+it ends and exports it with export():
+- as Prometheus text, e.g. for node_exporter's textfile collector
+- or as one JSON line per run
+
+system.log_level is honored:
+- DEBUG also prints every span as it ends.
+- WARNING and above hide the summary.
+
+SamplingProfiler is a low-overhead statistical profiler. A thread samples
+the stacks of all other threads at a fixed interval. The result is
+written as collapsed stacks, the input format of flamegraph.pl and
+speedscope.
+"""
+import collections
+import datetime
+import functools
+import json
+import os
+import re
+import sys
+import threading
+import time
+
+_LEVELS = {'DEBUG': 10, 'INFO': 20, 'WARNING': 30, 'ERROR': 40, 'CRITICAL': 50}
+
+
+class _Span:
+    __slots__ = ('registry', 'name', 'started')
+
+    def __init__(self, registry, name):
+        self.registry = registry
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.registry.record(self.name, time.perf_counter() - self.started)
+        return False
+
+
+class Metrics:
+    def __init__(self):
+        self.level = _LEVELS['INFO']
+        self._lock = threading.Lock()
+        self.reset()
+
+    def configure(self, log_level='INFO'):
+        self.level = _LEVELS.get(str(log_level).upper(), _LEVELS['INFO'])
+
+    def reset(self):
+        """Start a new run."""
+        with self._lock:
+            self.spans = {}     # name -> [count, total seconds, max seconds]
+            self.counters = {}  # name -> number
+            self.started_at = time.time()
+
+    def span(self, name):
+        """Context manager timing the block as `name`."""
+        return _Span(self, name)
+
+    def record(self, name, seconds):
+        with self._lock:
+            entry = self.spans.get(name)
+            if entry is None:
+                self.spans[name] = [1, seconds, seconds]
+            else:
+                entry[0] += 1
+                entry[1] += seconds
+                if seconds > entry[2]:
+                    entry[2] = seconds
+        if self.level <= _LEVELS['DEBUG']:
+            print(f"[span] {name} {seconds * 1000:.1f} ms")
+
+    def timed(self, name):
+        """Decorator timing every call of a function as `name`."""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with _Span(self, name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def merge(self, run):
+        """Add a snapshot() taken in another process (a shard worker) to this run."""
+        with self._lock:
+            for name, values in run['spans'].items():
+                entry = self.spans.setdefault(name, [0, 0.0, 0.0])
+                entry[0] += values['count']
+                entry[1] += values['total_s']
+                entry[2] = max(entry[2], values['max_s'])
+            for name, value in run['counters'].items():
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    def summary(self, top=10):
+        """Printable lines: the spans with the most total time, then the counters."""
+        with self._lock:
+            spans = sorted(self.spans.items(), key=lambda item: -item[1][1])
+            counters = sorted(self.counters.items())
+        lines = ["--- Run metrics ---"]
+        for name, (count, total, longest) in spans[:top]:
+            lines.append(f"{name:<36}{count:>7}x {total * 1000:>10.1f} ms (max {longest * 1000:.1f} ms)")
+        if counters:
+            lines.append("Counters: " + ", ".join(f"{name}={value}" for name, value in counters))
+        return lines
+
+    def print_summary(self):
+        if self.level <= _LEVELS['INFO']:
+            for line in self.summary():
+                print(line)
+
+    def snapshot(self, **labels):
+        """The run as a dict (one JSON line of the jsonl export)."""
+        with self._lock:
+            return {
+                'ts': datetime.datetime.fromtimestamp(self.started_at).isoformat(timespec='seconds'),
+                'duration_s': round(time.time() - self.started_at, 3),
+                **labels,
+                'spans': {name: {'count': count, 'total_s': round(total, 6), 'max_s': round(longest, 6)}
+                          for name, (count, total, longest) in self.spans.items()},
+                'counters': dict(self.counters),
+            }
+
+    def prometheus(self, **labels):
+        """The run in the Prometheus text exposition format."""
+        run = self.snapshot(**labels)
+        extra = ''.join(f',{key}="{_escape(value)}"' for key, value in labels.items())
+        base = '{' + extra[1:] + '}' if extra else ''
+        lines = [
+            "# HELP idle_run_timestamp_seconds Start of the last check run.",
+            "# TYPE idle_run_timestamp_seconds gauge",
+            f"idle_run_timestamp_seconds{base} {self.started_at:.0f}",
+            "# HELP idle_run_duration_seconds Wall time of the last check run.",
+            "# TYPE idle_run_duration_seconds gauge",
+            f"idle_run_duration_seconds{base} {run['duration_s']}",
+        ]
+        for metric, key, kind, help_text in (
+            ('idle_span_calls', 'count', 'gauge', 'Timed calls per span in the last run.'),
+            ('idle_span_seconds', 'total_s', 'gauge', 'Seconds spent per span in the last run.'),
+            ('idle_span_max_seconds', 'max_s', 'gauge', 'Longest single call per span in the last run.'),
+        ):
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {kind}"]
+            for name, values in sorted(run['spans'].items()):
+                lines.append(f'{metric}{{span="{_escape(name)}"{extra}}} {values[key]}')
+        for name, value in sorted(run['counters'].items()):
+            metric = 'idle_' + re.sub(r'[^a-zA-Z0-9_]', '_', name)
+            lines += [f"# TYPE {metric} gauge", f"{metric}{base} {value}"]
+        return "\n".join(lines) + "\n"
+
+    def export(self, path, **labels):
+        """
+        Write the run to `path`: appended as a JSON line for .jsonl/.json
+        files, otherwise as Prometheus text (replacing the file atomically).
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        if path.endswith(('.jsonl', '.json')):
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(self.snapshot(**labels), ensure_ascii=False) + "\n")
+            return
+        tmp = path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(self.prometheus(**labels))
+        os.replace(tmp, path)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# The process-wide registry
+REGISTRY = Metrics()
+configure = REGISTRY.configure
+reset = REGISTRY.reset
+span = REGISTRY.span
+timed = REGISTRY.timed
+record = REGISTRY.record
+incr = REGISTRY.incr
+print_summary = REGISTRY.print_summary
+export = REGISTRY.export
+
+
+class SamplingProfiler(threading.Thread):
+    """
+    Samples the Python stacks of all other threads every `interval`
+    seconds. Each sample costs one sys._current_frames() call and a walk
+    of the stacks, so a 5 ms interval slows the program down by a few
+    percent at most.
+    """
+    def __init__(self, interval=0.005):
+        super().__init__(name='sampling-profiler', daemon=True)
+        self.interval = interval
+        self.samples = 0
+        self.stacks = collections.Counter()  # collapsed stack -> samples
+        self._stop_event = threading.Event()
+
+    def run(self):
+        me = threading.get_ident()
+        names = {}
+        while not self._stop_event.wait(self.interval):
+            for thread in threading.enumerate():
+                names.setdefault(thread.ident, thread.name)
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def top(self, n=15, thread='MainThread'):
+        """
+        [(function, samples)] of one thread by self time (the innermost
+        frame of each sample). Other threads mostly sit in waits.
+        """
+        leaves = collections.Counter()
+        for stack, count in self.stacks.items():
+            if stack.startswith(thread + ';'):
+                leaves[stack.rsplit(';', 1)[-1]] += count
+        return leaves.most_common(n)
+
+    def write(self, path):
+        """Collapsed stacks, one 'frame;frame;... samples' line each."""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write(f"{stack} {count}\n")
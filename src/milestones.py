@@ -0,0 +1,140 @@
+"""
+Milestone rules shared by the checker and the ETA engine.
+"""
+from bisect import bisect_left, bisect_right
+from typing import NamedTuple, Optional
+
+
+def get_milestone_step(view_count, milestones_config):
+    """
+    Determine the appropriate step (increment) based on current view count and rules.
+    """
+    rules = milestones_config.get('dynamic_rules', [])
+    # If no dynamic rules, fallback to static 'step'
+    if not rules:
+        return milestones_config.get('step', 1000000)
+    
+    # Check rules (assuming they are sorted desc or we just find first match > threshold)
+    # The config has them listed. We should iterate.
+    for rule in rules:
+        if view_count >= rule['threshold']:
+            return rule['step']
+    
+    return milestones_config.get('step', 1000000)
+
+
+class MilestoneEvent(NamedTuple):
+    """
+    A post candidate produced by MilestoneEvaluator.
+    action_type: 'achieved' or 'support_<remaining trigger>'
+    milestone_value: the achieved milestone, or the upcoming one for support
+    """
+    video_id: str
+    action_type: str
+    milestone_value: int
+    view_count: int
+    step: int
+    trigger: Optional[int] = None
+
+    @property
+    def is_support(self):
+        return self.trigger is not None
+
+    @property
+    def next_goal(self):
+        """For 'achieved': the milestone after this one."""
+        return self.milestone_value + self.step
+
+    @property
+    def remaining(self):
+        """For support: views left until milestone_value."""
+        return self.milestone_value - self.view_count
+
+
+class MilestoneEvaluator:
+    """
+    A target's milestone rules and support triggers, compiled once so a
+    whole batch of videos can be evaluated with two binary searches each.
+    
+    The step table reproduces get_milestone_step() exactly, including its
+    "first listed rule wins" semantics for unsorted dynamic_rules: between
+    two consecutive thresholds the step is constant, so it is resolved
+    once per interval here instead of once per video.
+    """
+    def __init__(self, milestones_config, support_triggers=()):
+        rules = milestones_config.get('dynamic_rules', [])
+        default_step = milestones_config.get('step', 1000000)
+        self.initial_target = milestones_config['initial_target']
+        
+        # Interval starts (ascending) and the step that applies from each one
+        self._bounds = sorted({rule['threshold'] for rule in rules})
+        self._steps = [get_milestone_step(t, milestones_config) for t in self._bounds]
+        self._default_step = default_step
+        
+        # Sorted ascending: the most urgent (smallest) trigger is checked first
+        self._triggers = sorted(t['remaining'] for t in support_triggers)
+        self._support_actions = [f"support_{t}" for t in self._triggers]
+
+    @classmethod
+    def for_target(cls, target):
+        return cls(target['milestones'], target.get('support_trigger', []))
+
+    def step_for(self, view_count):
+        i = bisect_right(self._bounds, view_count) - 1
+        return self._steps[i] if i >= 0 else self._default_step
+
+    def next_event(self, view_count):
+        """
+        Smallest view count above view_count at which something would be
+        posted: the next milestone, or a support trigger point before it.
+        """
+        step = self.step_for(view_count)
+        next_milestone = (view_count // step) * step + step
+        event = next_milestone
+        for trigger in self._triggers:
+            point = next_milestone - trigger
+            if view_count < point < event:
+                event = point
+        return event
+
+    def evaluate(self, video_ids, view_counts, history=None):
+        """
+        Evaluate a batch of videos in one pass.
+        
+        video_ids / view_counts: parallel sequences
+        history: optional container of (video_id, action_type, milestone_value)
+                 keys already posted; matching events are left out
+        
+        Returns the list of MilestoneEvents, per video the achievement
+        (if any) before the support event (if any).
+        """
+        bounds = self._bounds
+        steps = self._steps
+        default_step = self._default_step
+        initial_target = self.initial_target
+        triggers = self._triggers
+        support_actions = self._support_actions
+        n_triggers = len(triggers)
+        events = []
+        append = events.append
+        
+        for vid, views in zip(video_ids, view_counts):
+            i = bisect_right(bounds, views) - 1
+            step = steps[i] if i >= 0 else default_step
+            achieved = (views // step) * step
+            
+            if achieved >= initial_target:
+                key = (vid, 'achieved', achieved)
+                if history is None or key not in history:
+                    append(MilestoneEvent(vid, 'achieved', achieved, views, step))
+            
+            if n_triggers:
+                next_milestone = achieved + step
+                remaining = next_milestone - views
+                # Only the smallest trigger covering `remaining` applies
+                j = bisect_left(triggers, remaining)
+                if j < n_triggers and remaining > 0:
+                    action_type = support_actions[j]
+                    if history is None or (vid, action_type, next_milestone) not in history:
+                        append(MilestoneEvent(vid, action_type, next_milestone, views, step, triggers[j]))
+        return events
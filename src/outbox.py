@@ -0,0 +1,284 @@
+"""
+Background X posting from the durable post_outbox table.
+
+The check cycle only queues rendered posts (in the same transaction that
+records them in post_history) and moves on. One dispatcher thread per
+account_id sends its queue in order, paced by a token bucket, and retries
+rate limits (429), server errors (5xx) and network errors with exponential
+backoff. Posts that are still pending when the process exits are picked up
+by the next run.
+"""
+import random
+import sqlite3
+import threading
+import time
+
+import metrics
+from db_manager import DatabaseManager
+
+
+class PostError(Exception):
+    """
+    A failed post. status is the HTTP status (None for network errors);
+    retry_at is the unix time the rate limit resets, when known.
+    """
+    def __init__(self, message, status=None, retry_at=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_at = retry_at
+
+    @property
+    def retryable(self):
+        return self.status is None or self.status == 429 or self.status >= 500
+
+
+class TokenBucket:
+    """
+    Allows `burst` posts at once, refilled at `per_hour` posts per hour.
+    Used by a single dispatcher thread, so it needs no lock.
+    """
+    def __init__(self, per_hour, burst, clock=time.monotonic):
+        self.per_hour = per_hour
+        self.burst = max(burst, 1)
+        self.clock = clock
+        self.tokens = float(self.burst)
+        self.updated = clock()
+        self.blocked_until = 0.0
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.per_hour / 3600.0)
+        self.updated = now
+        return now
+
+    def take(self):
+        """Take a token. Returns 0 if one was taken, else the seconds to wait for one."""
+        now = self._refill()
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        if self.per_hour <= 0:
+            return 3600.0
+        return (1 - self.tokens) * 3600.0 / self.per_hour
+
+    def block_for(self, seconds):
+        """Drain the bucket and allow nothing for `seconds` (the API said to back off)."""
+        now = self._refill()
+        self.tokens = 0.0
+        self.blocked_until = max(self.blocked_until, now + seconds)
+
+
+class AccountDispatcher(threading.Thread):
+    """
+    Sends the pending posts of one account. Uses its own DB connection:
+    the main thread's connection is busy with the check cycle's transactions.
+    """
+    def __init__(self, outbox, account_id):
+        super().__init__(name=f"outbox-{account_id}", daemon=True)
+        self.outbox = outbox
+        self.account_id = account_id
+        self.bucket = TokenBucket(outbox.per_hour, outbox.burst)
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.post_ms = []    # latency of each successful post, client lookup included
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+        self._wake_seq = 0   # bumped by wake()
+        self._idle_seq = 0   # last wake_seq after which the queue was seen empty
+
+    def wake(self):
+        """New posts were committed: look at the queue again."""
+        self._wake_seq += 1
+        self._wake.set()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake.set()
+
+    @property
+    def idle(self):
+        """True when nothing was due the last time the queue was read after the last wake()."""
+        return self._idle_seq >= self._wake_seq
+
+    def run(self):
+        db = DatabaseManager(self.outbox.db_path)
+        try:
+            while not self._stop_event.is_set():
+                seq = self._wake_seq
+                self._wake.clear()
+                try:
+                    posts = db.get_due_posts(self.account_id)
+                except Exception as e:  # e.g. "database is locked": try again shortly
+                    print(f"[outbox:{self.account_id}] Reading the queue failed: {e}")
+                    self._stop_event.wait(1.0)
+                    continue
+                if not posts:
+                    self._idle_seq = seq
+                    next_at = db.next_post_attempt(self.account_id)
+                    timeout = self.outbox.poll_seconds
+                    if next_at is not None:
+                        timeout = min(max(next_at - time.time(), 0.01), timeout)
+                    self._wake.wait(timeout)
+                    continue
+                for post in posts:
+                    wait = self.bucket.take()
+                    while wait > 0:
+                        if self._stop_event.wait(wait):
+                            return
+                        wait = self.bucket.take()
+                    self._send(db, post)
+        finally:
+            db.close()
+
+    def _send(self, db, post):
+        outbox = self.outbox
+        started = time.perf_counter()
+        try:
+            client = outbox.client_factory(self.account_id)
+            with metrics.span('x.post_tweet'):
+                tweet_id = client.send_tweet(post['message'])
+        except Exception as e:
+            error = e if isinstance(e, PostError) else PostError(str(e))
+            attempts = post['attempts'] + 1
+            if error.retryable and attempts < outbox.max_attempts:
+                # Exponential backoff with jitter; a known rate limit reset wins
+                delay = min(outbox.backoff_seconds * 2 ** (attempts - 1), outbox.max_backoff_seconds)
+                delay *= random.uniform(0.5, 1.0)
+                if error.retry_at:
+                    delay = max(delay, error.retry_at - time.time())
+                if error.status == 429:
+                    self.bucket.block_for(delay)
+                self._record(db, db.mark_post_retry, post['id'], error, time.time() + delay)
+                self.retried += 1
+                metrics.incr('tweets_retried')
+                print(f"[outbox:{self.account_id}] Post {post['id']} failed ({error}); retry {attempts} in {delay:.0f}s")
+            else:
+                self._record(db, db.mark_post_failed, post['id'], error)
+                self.failed += 1
+                metrics.incr('tweets_failed')
+                print(f"[outbox:{self.account_id}] Giving up on post {post['id']} after {attempts} attempts: {error}")
+            return
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self._record(db, db.mark_post_sent, post['id'], tweet_id)
+        self.sent += 1
+        metrics.incr('tweets_sent')
+        self.post_ms.append(elapsed_ms)
+        print(f"[outbox:{self.account_id}] Tweet posted successfully: {tweet_id} ({elapsed_ms:.0f} ms)")
+
+
+    def _record(self, db, write, *args):
+        """
+        Run a status write of a post that was just attempted, retrying with
+        backoff while the DB is busy (e.g. "database is locked"). Giving up
+        would leave a sent post pending, to be sent again on the next run.
+        """
+        delay = 0.5
+        while True:
+            try:
+                return write(*args)
+            except sqlite3.OperationalError as e:
+                # Drop the half-done write so the retry applies it exactly once
+                db.rollback()
+                print(f"[outbox:{self.account_id}] Recording the post status failed ({e}); retrying in {delay:.1f}s")
+                time.sleep(delay)
+                delay = min(delay * 2, 10.0)
+
+
+class PostOutbox:
+    """
+    Dispatchers for all accounts, started on first use. client_factory
+    (account_id -> client with send_tweet(text)) is called in the
+    dispatcher thread for every post, so it should return a pooled client.
+    """
+    def __init__(self, db_path, client_factory, per_hour=20, burst=5, max_attempts=8,
+                 backoff_seconds=30, max_backoff_seconds=3600, poll_seconds=30):
+        self.db_path = db_path
+        self.client_factory = client_factory
+        self.per_hour = per_hour
+        self.burst = burst
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.poll_seconds = poll_seconds
+        self.dispatchers = {}
+
+    @classmethod
+    def from_config(cls, db_path, config, client_factory):
+        outbox = cls(db_path, client_factory)
+        outbox.configure(config)
+        return outbox
+
+    def configure(self, config):
+        """Apply system.x_posting settings, also to running dispatchers."""
+        settings = config.get('system', {}).get('x_posting', {})
+        self.per_hour = settings.get('posts_per_hour', 20)
+        self.burst = settings.get('burst', 5)
+        self.max_attempts = settings.get('max_attempts', 8)
+        self.backoff_seconds = settings.get('backoff_seconds', 30)
+        for d in self.dispatchers.values():
+            d.bucket.per_hour = self.per_hour
+            d.bucket.burst = max(self.burst, 1)
+
+    def dispatcher(self, account_id):
+        dispatcher = self.dispatchers.get(account_id)
+        if dispatcher is None or not dispatcher.is_alive():
+            dispatcher = AccountDispatcher(self, account_id)
+            self.dispatchers[account_id] = dispatcher
+            dispatcher.start()
+        return dispatcher
+
+    def wake(self, account_id):
+        """Call after committing queued posts of an account."""
+        self.dispatcher(account_id).wake()
+
+    def resume(self, account_ids):
+        """Start the dispatchers of accounts with posts left over from earlier runs."""
+        for account_id in account_ids:
+            self.wake(account_id)
+
+    def drain(self, timeout):
+        """
+        Wait up to `timeout` seconds until no account has a post that is due.
+        Posts waiting for a retry later stay queued. Returns True if drained.
+        """
+        deadline = time.monotonic() + timeout
+        while any(not d.idle for d in self.dispatchers.values() if d.is_alive()):
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def stats(self):
+        """
+        Totals across dispatchers since start: {'sent', 'retried', 'failed'}
+        and the mean / median latency of successful posts in ms.
+        """
+        totals = {'sent': 0, 'retried': 0, 'failed': 0}
+        post_ms = []
+        for d in self.dispatchers.values():
+            totals['sent'] += d.sent
+            totals['retried'] += d.retried
+            totals['failed'] += d.failed
+            post_ms.extend(d.post_ms)
+        if post_ms:
+            post_ms.sort()
+            totals['mean_post_ms'] = round(sum(post_ms) / len(post_ms), 1)
+            totals['median_post_ms'] = round(post_ms[len(post_ms) // 2], 1)
+        return totals
+
+    def close(self, drain_timeout=0):
+        """Optionally drain, then stop every dispatcher."""
+        if drain_timeout:
+            if not self.drain(drain_timeout):
+                print("Outbox: timed out waiting for posts; the rest is sent on the next run.")
+        stats = self.stats()
+        if stats['sent'] or stats['retried'] or stats['failed']:
+            print("Outbox dispatch: " + ", ".join(f"{k}={v}" for k, v in stats.items()))
+        for d in self.dispatchers.values():
+            d.stop()
+        for d in self.dispatchers.values():
+            d.join(timeout=5)
+        self.dispatchers = {}
@@ -0,0 +1,404 @@
+"""
+Per-target processing pipeline of a check cycle.
+
+    fetch -> filter -> persist -> evaluate -> render -> dispatch
+
+TargetFetch (the fetch stage) streams a target's videos in batches: one
+batch per page of new uploads, then one batch of tracked videos refreshed
+through the stats cache. Every batch goes through the remaining stages in
+order. As a result, every video of the cycle is filtered, stored,
+evaluated, rendered and dispatched exactly once, whether it came from the
+uploads or the tracked list.
+
+Stages are plain functions stage(batch, pipeline) that update the batch
+in place. They can be swapped or added by name (Pipeline.replace /
+Pipeline.insert_after). The time spent in each stage is accumulated in
+StageTimings, so a stage can be profiled (and moved to a pool) on its own.
+"""
+import queue
+import threading
+import time
+
+import metrics
+from quota import QuotaExceeded
+from templates import format_number, render_events
+from youtube_client import ChannelPageError
+
+UPLOADS = 'uploads'
+TRACKED = 'tracked'
+
+
+class Batch:
+    """
+    Videos moving through the pipeline together, plus what the stages
+    derived from them.
+    source: UPLOADS or TRACKED
+    fetched: number of videos fetched (before the filter stage)
+    """
+    __slots__ = ('source', 'videos', 'fetched', 'titles', 'events', 'messages')
+
+    def __init__(self, source, videos):
+        self.source = source
+        self.videos = videos
+        self.fetched = len(videos)
+        self.titles = None
+        self.events = ()
+        self.messages = ()
+
+
+class TargetFetch:
+    """
+    The fetch stage of one target: stream the new uploads of the channel
+    page by page, then the tracked videos, as Batches.
+
+    start(pool) runs the fetch in a worker thread that hands batches over
+    a bounded queue, so the pipeline processes page N while page N+1 is
+    being fetched. Without a pool, batches() fetches inline. Either way,
+    only one or a few pages are held in memory. The fetch must not touch
+    the DB.
+
+    After batches() is exhausted, these attributes are set:
+    - uploads_playlist_id: None if the channel could not be resolved, in
+      which case the target is skipped
+    - newest: the newest upload seen, the new high-water mark. None unless
+      paging reached the old mark (or the end of the listing): after a
+      failed page, the uploads behind it were never seen, so the old mark
+      has to stay
+    - fetched: the number of uploads seen
+    - tracked_ids: the tracked videos still to evaluate
+    - quota_skipped: the number of tracked videos not refreshed
+    """
+    _DONE = object()
+
+    def __init__(self, plan, yt_client, stats_cache, channel_state, tracked_ids, full_scan,
+                 queue_pages=4):
+        self.plan = plan
+        self.yt_client = yt_client
+        self.stats_cache = stats_cache
+        self.channel_state = channel_state
+        self.tracked_ids = tracked_ids
+        self.full_scan = full_scan
+        self.uploads_playlist_id = None
+        self.newest = None
+        self.fetched = 0
+        self.quota_skipped = 0
+        self._queue = queue.Queue(maxsize=queue_pages)
+        self._cancelled = threading.Event()
+        self._future = None
+
+    def start(self, pool):
+        self._future = pool.submit(self._produce)
+        return self
+
+    def cancel(self):
+        """Stop a threaded fetch early (its worker may be blocked on a full queue)."""
+        self._cancelled.set()
+
+    def batches(self):
+        """Yield the uploads Batches (newest first), then the tracked Batch."""
+        if self._future is None:
+            yield from self._fetch()
+            return
+        try:
+            while True:
+                batch = self._queue.get()
+                if batch is self._DONE:
+                    break
+                yield batch
+            # Re-raise anything unexpected from the worker
+            self._future.result()
+        finally:
+            self.cancel()
+
+    def _produce(self):
+        try:
+            for batch in self._fetch():
+                if not self._put(batch):
+                    return
+        finally:
+            self._put(self._DONE)
+
+    def _put(self, item):
+        while not self._cancelled.is_set():
+            try:
+                self._queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _fetch(self):
+        quota = self.yt_client.quota
+        quota.begin_target(self.plan.artist_name)
+        try:
+            yield from self._fetch_uploads()
+            yield from self._fetch_tracked()
+        finally:
+            # All API calls of the target are done: release its unused allowance
+            quota.end_target(self.plan.artist_name)
+
+    def _fetch_uploads(self):
+        plan = self.plan
+        channel_id = plan.channel_id
+        channel_state = self.channel_state
+
+        # Fetch videos from channel: only uploads newer than the stored
+        # high-water mark (known videos are refreshed as the tracked batch)
+        uploads_playlist_id = channel_state.get('uploads_playlist_id')
+        if not uploads_playlist_id:
+            try:
+                uploads_playlist_id = self.yt_client.get_uploads_playlist_id(channel_id)
+            except QuotaExceeded as e:
+                print(f"[SKIPPED] {plan.artist_name}: {e}")
+                return
+            except Exception as e:
+                print(f"An error occurred while resolving channel {channel_id}: {e}")
+                return
+            if not uploads_playlist_id:
+                print(f"Channel {channel_id} not found.")
+                return
+        self.uploads_playlist_id = uploads_playlist_id
+        since = None
+        if channel_state.get('last_published_at'):
+            since = {'video_id': channel_state['last_video_id'],
+                     'published_at': channel_state['last_published_at']}
+
+        # Uploads of this cycle are not fetched again as tracked videos
+        fetched_ids = set()
+        newest = None
+        try:
+            for page in self.yt_client.iter_channel_videos(
+                channel_id, limit=50, full_scan=self.full_scan,
+                uploads_playlist_id=uploads_playlist_id, since=since,
+                stats_cache=self.stats_cache
+            ):
+                self.fetched += len(page)
+                page_newest = max(page, key=lambda v: v.published_at)
+                if newest is None or page_newest.published_at > newest.published_at:
+                    newest = page_newest
+                fetched_ids.update(v.id for v in page)
+                yield Batch(UPLOADS, page)
+            # Paging finished: the mark may move
+            self.newest = newest
+        except QuotaExceeded as e:
+            print(f"Quota limit reached, stopping fetch: {e}")
+        except ChannelPageError as e:
+            # Pages before the failed one were already handed out
+            print(f"An error occurred: {e}")
+
+        self.tracked_ids = [v for v in self.tracked_ids if v not in fetched_ids]
+
+    def _fetch_tracked(self):
+        if self.uploads_playlist_id is None or not self.tracked_ids:
+            return
+        # Fetch stats only for videos not already in this run's stats cache
+        try:
+            self.stats_cache.prefetch(self.tracked_ids)
+        except QuotaExceeded:
+            # Degrade gracefully: the due list is most-urgent first, so
+            # running out of budget only drops the least urgent refreshes
+            self.quota_skipped = sum(1 for v in self.tracked_ids if v not in self.stats_cache)
+            metrics.incr('tracked_skipped_quota', self.quota_skipped)
+        stats_cache = self.stats_cache
+        yield Batch(TRACKED, [stats_cache.get(v) for v in self.tracked_ids if stats_cache.get(v)])
+
+
+# --- stages ---
+
+def filter_stage(batch, pipeline):
+    """Title keyword / exclude keyword / shorts filter."""
+    plan = pipeline.plan
+    batch.videos = [v for v in batch.videos if plan.is_relevant(v)]
+
+
+def persist_stage(batch, pipeline):
+    """One batched upsert of the changed videos (plus view snapshots) per batch."""
+    artist_name = pipeline.plan.artist_name
+    changed = pipeline.db.bulk_update_video_stats(
+        (v.id, v.title, artist_name, v.view_count) for v in batch.videos
+    )
+    pipeline.rows_changed += changed
+    pipeline.rows_unchanged += len(batch.videos) - changed
+
+
+def evaluate_stage(batch, pipeline):
+    """Milestone events of the whole batch, already posted ones left out."""
+    videos = batch.videos
+    batch.titles = {v.id: v.title for v in videos}
+    video_ids = [v.id for v in videos]
+    # The batch's history in one query; checks are answered from memory
+    pipeline.db.load_history(video_ids)
+    batch.events = pipeline.plan.evaluator.evaluate(
+        video_ids, [v.view_count for v in videos], history=pipeline.db.loaded_history
+    )
+    metrics.incr('videos_evaluated', len(videos))
+    metrics.incr('milestone_events', len(batch.events))
+
+
+def render_stage(batch, pipeline):
+    """All candidate messages of the batch in one pass (init mode posts nothing)."""
+    if batch.events and not pipeline.init_mode:
+        batch.messages = render_events(batch.events, batch.titles, pipeline.plan.templates)
+
+
+def dispatch_stage(batch, pipeline):
+    """
+    Queue posts for (or in init mode, silently record) the batch's events
+    in order, honoring the post limit of the cycle.
+
+    With an outbox the post is written to post_outbox together with its
+    history row and sent in the background; without one (no credentials)
+    the post is only simulated.
+    """
+    db = pipeline.db
+    outbox = pipeline.outbox
+    init_mode = pipeline.init_mode
+    max_posts = pipeline.max_posts
+
+    for i, event in enumerate(batch.events):
+        vid = event.video_id
+        title = batch.titles[vid]
+
+        if event.is_support:
+            # In init mode, just record to DB silently
+            if init_mode:
+                db.add_history(vid, event.action_type, event.milestone_value)
+                # Don't count support in post_count for init mode summary
+                continue
+
+            # Check post limit
+            if pipeline.post_count >= max_posts:
+                print(f"[SKIPPED] Post limit reached ({max_posts}). Skipping support: {title}")
+                metrics.incr('posts_skipped_max_posts')
+                continue
+
+            msg = batch.messages[i]
+
+            print(f"\n[POST REQUEST] !!! SUPPORT NEEDED ({event.trigger}) !!!")
+            print(f"Video: {title} is attached to {format_number(event.milestone_value)}")
+        else:
+            # Check post limit
+            if pipeline.post_count >= max_posts:
+                print(f"[SKIPPED] Post limit reached ({max_posts}). Skipping: {title}")
+                metrics.incr('posts_skipped_max_posts')
+                continue
+
+            # In init mode, just record to DB silently
+            if init_mode:
+                db.add_history(vid, event.action_type, event.milestone_value)
+                pipeline.post_count += 1
+                continue
+
+            msg = batch.messages[i]
+
+            print(f"\n[POST REQUEST] !!! ACHIEVEMENT UNLOCKED !!!")
+            print(f"Video: {title} passed {format_number(event.milestone_value)} views")
+
+        print("---------------------------------------------------")
+        print(msg)
+        print("---------------------------------------------------")
+
+        db.add_history(vid, event.action_type, event.milestone_value)
+        if outbox:
+            # Committed with the batch's transaction; the dispatcher retries until sent
+            if not db.enqueue_post(pipeline.plan.account_id, vid, event.action_type, event.milestone_value, msg):
+                # Already queued or sent (e.g. history recorded under another
+                # target): not a new post, so it does not count toward the limit
+                print("(Already queued; skipped)")
+                metrics.incr('posts_already_queued')
+                continue
+            pipeline.post_count += 1
+            print("(Queued for posting)")
+            metrics.incr('posts_queued')
+        else:
+            pipeline.post_count += 1
+            print("(Simulated post saved to DB)")
+            metrics.incr('posts_simulated')
+
+
+DEFAULT_STAGES = (
+    ('filter', filter_stage),
+    ('persist', persist_stage),
+    ('evaluate', evaluate_stage),
+    ('render', render_stage),
+    ('dispatch', dispatch_stage),
+)
+
+
+class StageTimings:
+    """Seconds, batches and videos per stage, accumulated over a cycle."""
+    def __init__(self):
+        self.stages = {}  # name -> [seconds, batches, videos]
+
+    def add(self, name, seconds, videos):
+        entry = self.stages.setdefault(name, [0.0, 0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+        entry[2] += videos
+
+    def summary(self):
+        parts = [f"{name} {seconds * 1000:.1f}ms/{batches}b/{videos}v"
+                 for name, (seconds, batches, videos) in self.stages.items()]
+        return "Pipeline: " + " | ".join(parts)
+
+
+class Pipeline:
+    """
+    The stages after fetch, run in order on each Batch. One Pipeline
+    serves a whole check cycle (the post limit is per cycle);
+    begin_target() selects the target the next batches belong to.
+    """
+    def __init__(self, db, init_mode, max_posts, stages=DEFAULT_STAGES):
+        self.db = db
+        self.init_mode = init_mode
+        self.max_posts = max_posts
+        self.stages = list(stages)
+        self.timings = StageTimings()
+        self.post_count = 0
+        # videos rows written / skipped as unchanged by the persist stage
+        self.rows_changed = 0
+        self.rows_unchanged = 0
+        self.plan = None
+        self.outbox = None
+
+    def replace(self, name, stage):
+        """Swap the stage called `name`."""
+        self.stages[self._index(name)] = (name, stage)
+
+    def insert_after(self, after, name, stage):
+        """Add a stage right after the stage called `after`."""
+        self.stages.insert(self._index(after) + 1, (name, stage))
+
+    def _index(self, name):
+        for i, (stage_name, _) in enumerate(self.stages):
+            if stage_name == name:
+                return i
+        raise KeyError(name)
+
+    def begin_target(self, plan, outbox):
+        self.plan = plan
+        self.outbox = outbox
+
+    def fetch(self, target_fetch):
+        """Yield the target's Batches, timing the wait for each as the fetch stage."""
+        batches = target_fetch.batches()
+        while True:
+            started = time.perf_counter()
+            batch = next(batches, None)
+            if batch is None:
+                return
+            elapsed = time.perf_counter() - started
+            self.timings.add('fetch', elapsed, batch.fetched)
+            metrics.record('stage.fetch', elapsed)
+            yield batch
+
+    def process(self, batch):
+        """Run every stage on the batch."""
+        timings = self.timings
+        for name, stage in self.stages:
+            started = time.perf_counter()
+            stage(batch, self)
+            elapsed = time.perf_counter() - started
+            timings.add(name, elapsed, len(batch.videos))
+            metrics.record('stage.' + name, elapsed)
+        return batch
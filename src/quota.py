@@ -0,0 +1,197 @@
+"""
+Quota-aware request scheduling for the YouTube Data API.
+
+Every API call is charged against a daily unit quota (10,000 by default)
+that resets at midnight Pacific Time. QuotaScheduler counts the units of
+each call type, persists the daily total in the DB so separate runs share
+one budget, and splits a per-run budget across targets by priority.
+When a target's allowance is used up, spend() raises QuotaExceeded so the
+caller can skip low-priority work instead of failing the whole run.
+
+The scheduler is thread-safe. The target being charged is tracked per
+thread, and usage is buffered in memory until flush() so that only the
+thread owning the DB writes to it.
+"""
+import datetime
+import threading
+from contextlib import contextmanager
+
+import metrics
+
+try:
+    from zoneinfo import ZoneInfo
+    _QUOTA_TZ = ZoneInfo("America/Los_Angeles")
+except Exception:  # tzdata missing: fall back to UTC days
+    _QUOTA_TZ = datetime.timezone.utc
+
+# Units per call (https://developers.google.com/youtube/v3/determine_quota_cost)
+QUOTA_COSTS = {
+    'channels.list': 1,
+    'playlistItems.list': 1,
+    'videos.list': 1,
+    'search.list': 100,
+}
+
+
+class QuotaExceeded(Exception):
+    """Raised when a call would exceed the daily quota or the current allowance."""
+
+
+def quota_day(now=None):
+    """The quota day (Pacific date) as 'YYYY-MM-DD'."""
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    return now.astimezone(_QUOTA_TZ).strftime('%Y-%m-%d')
+
+
+class QuotaScheduler:
+    def __init__(self, db=None, daily_limit=10000, run_budget=None, costs=None, clock=None):
+        """
+        db: DatabaseManager used to persist daily usage (None keeps it in memory)
+        daily_limit: project quota per Pacific day
+        run_budget: max units a single run may use (None = whatever is left today)
+        clock: callable returning an aware datetime (for tests)
+        """
+        self.db = db
+        self.daily_limit = daily_limit
+        self.costs = dict(QUOTA_COSTS, **(costs or {}))
+        self.clock = clock
+        self.day = quota_day(self._now())
+        self.used_today = sum(db.get_quota_usage(self.day).values()) if db else 0
+        remaining = max(self.daily_limit - self.used_today, 0)
+        self.run_budget = remaining if run_budget is None else min(run_budget, remaining)
+        self.run_used = 0
+        self.calls = {}  # call_type -> count this run
+        self._weights = {}
+        self._pending = []  # targets planned but not started yet
+        self._allowances = {}  # target -> units left (targets without an entry are unlimited)
+        self._unflushed = {}  # (day, call_type) -> units not yet written to the DB
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @classmethod
+    def from_config(cls, db, config):
+        opts = config.get('system', {}).get('quota', {})
+        return cls(db, daily_limit=opts.get('daily_limit', 10000), run_budget=opts.get('run_budget'))
+
+    def _now(self):
+        return self.clock() if self.clock else datetime.datetime.now(datetime.timezone.utc)
+
+    def cost(self, call_type):
+        return self.costs.get(call_type, 1)
+
+    @property
+    def run_remaining(self):
+        return self.run_budget - self.run_used
+
+    def plan(self, targets):
+        """
+        Register the targets of this run. Each target gets a share of the
+        remaining run budget proportional to its 'priority' (default 1) when
+        it starts, so units left over by one target carry to the next.
+        """
+        self._weights = {t['artist_name']: max(float(t.get('priority', 1)), 0.0) for t in targets}
+        self._pending = [t['artist_name'] for t in targets]
+
+    @property
+    def current_target(self):
+        """Target charged by calls made from the current thread."""
+        return getattr(self._local, 'target', None)
+
+    @contextmanager
+    def use_target(self, name):
+        """Charge calls made from this thread to an already started target."""
+        previous = self.current_target
+        self._local.target = name
+        try:
+            yield
+        finally:
+            self._local.target = previous
+
+    def begin_target(self, name):
+        """Start charging this thread's calls to a target and compute its allowance."""
+        with self._lock:
+            if name in self._pending:
+                self._pending.remove(name)
+            # Units promised to targets that are still running are not available
+            available = max(self.run_remaining - self._reserved(exclude=name), 0)
+            weight = self._weights.get(name, 1.0)
+            pending_weight = weight + sum(self._weights.get(n, 1.0) for n in self._pending)
+            if pending_weight > 0:
+                self._allowances[name] = int(available * weight / pending_weight)
+            else:
+                self._allowances[name] = available
+        self._local.target = name
+        return self._allowances[name]
+
+    def end_target(self, name):
+        """Release the unused allowance of a finished target back to the run."""
+        with self._lock:
+            self._allowances.pop(name, None)
+
+    def _reserved(self, exclude=None):
+        return sum(units for name, units in self._allowances.items() if name != exclude)
+
+    def _fits(self, units):
+        if units > self.run_remaining:
+            return False
+        allowance = self._allowances.get(self.current_target)
+        return allowance is None or units <= allowance
+
+    def spend(self, call_type):
+        """Charge one call. Raises QuotaExceeded (without charging) if it does not fit."""
+        units = self.cost(call_type)
+        target = self.current_target
+        with self._lock:
+            if not self._fits(units):
+                raise QuotaExceeded(
+                    f"Quota budget exhausted for {target or 'run'} "
+                    f"({call_type}, {self.run_used}/{self.run_budget} units used this run)"
+                )
+            day = quota_day(self._now())
+            if day != self.day:
+                # Pacific midnight passed: a fresh daily quota
+                self.day = day
+                self.used_today = 0
+            self.run_used += units
+            self.used_today += units
+            if target in self._allowances:
+                self._allowances[target] -= units
+            self.calls[call_type] = self.calls.get(call_type, 0) + 1
+            key = (self.day, call_type)
+            self._unflushed[key] = self._unflushed.get(key, 0) + units
+        metrics.incr('youtube_quota_units', units)
+        return units
+
+    def take_usage(self):
+        """Return and clear the buffered usage {(day, call_type): units}."""
+        with self._lock:
+            pending, self._unflushed = self._unflushed, {}
+        return pending
+
+    def add_usage(self, usage, calls):
+        """
+        Charge usage recorded by another scheduler (a shard's slice in a
+        worker process) to this run; it is written by the next flush().
+        usage: {(day, call_type): units}, calls: {call_type: count}
+        """
+        with self._lock:
+            for (day, call_type), units in usage.items():
+                self.run_used += units
+                if day == self.day:
+                    self.used_today += units
+                key = (day, call_type)
+                self._unflushed[key] = self._unflushed.get(key, 0) + units
+            for call_type, count in calls.items():
+                self.calls[call_type] = self.calls.get(call_type, 0) + count
+
+    def flush(self):
+        """Write buffered usage to the DB. Call from the thread that owns the DB."""
+        pending = self.take_usage()
+        if self.db:
+            for (day, call_type), units in pending.items():
+                self.db.add_quota_usage(day, call_type, units)
+
+    def summary(self):
+        calls = ", ".join(f"{k}={v}" for k, v in sorted(self.calls.items())) or "none"
+        return (f"Quota: {self.run_used}/{self.run_budget} units this run, "
+                f"{self.used_today}/{self.daily_limit} today ({calls})")
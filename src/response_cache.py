@@ -0,0 +1,154 @@
+"""
+On-disk cache of API responses for conditional requests.
+
+Uploads playlist pages and channels.list responses rarely change between
+runs. The cache keeps each response with its ETag; the next identical
+request is sent with If-None-Match and a 304 Not Modified answer is served
+from the cache instead of downloading and parsing the body again.
+
+Entries live in a small SQLite file under .cache/ (not the committed DB).
+They are evicted when their body is older than max_age_days, and least
+recently used first beyond max_entries.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import metrics
+
+DEFAULT_CACHE_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.cache', 'responses.db'
+)
+
+
+def request_key(uri):
+    """Cache key of a request URI: path plus sorted query, without the API key."""
+    parts = urlsplit(uri)
+    params = sorted((k, v) for k, v in parse_qsl(parts.query) if k not in ('key', 'alt'))
+    return f"{parts.path}?{urlencode(params)}"
+
+
+class ResponseCache:
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=5000, max_age_days=7, memory_entries=256):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age_days = max_age_days
+        self.memory_entries = memory_entries
+        self._memory = OrderedDict()  # key -> (etag, parsed response), most recent last
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                etag TEXT NOT NULL,
+                body TEXT NOT NULL,
+                stored_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        ''')
+        self._conn.commit()
+        self.hits = 0        # 304: served from the cache
+        self.misses = 0      # no usable entry
+        self.changed = 0     # entry was sent but the response had changed
+        self.bytes_saved = 0
+
+    @classmethod
+    def from_config(cls, config):
+        """The cache configured in system.response_cache, or None if disabled."""
+        settings = config.get('system', {}).get('response_cache', {})
+        if not settings.get('enabled', True):
+            return None
+        return cls(
+            max_entries=settings.get('max_entries', 5000),
+            max_age_days=settings.get('max_age_days', 7),
+        )
+
+    def lookup(self, key, now=None):
+        """Return (etag, response) of a fresh entry, or None."""
+        now = now if now is not None else time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                if entry[2] >= now - self.max_age_days * 86400:
+                    return entry[0], entry[1]
+                del self._memory[key]
+                return None
+            row = self._conn.execute(
+                'SELECT etag, body, stored_at FROM responses WHERE key = ? AND stored_at >= ?',
+                (key, now - self.max_age_days * 86400)
+            ).fetchone()
+        if row is None:
+            return None
+        etag, body, stored_at = row
+        response = json.loads(body)
+        self._remember(key, (etag, response, stored_at, len(body)))
+        return etag, response
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def hit(self, key, now=None):
+        """The server answered 304 for a looked-up entry."""
+        now = now if now is not None else time.time()
+        metrics.incr('response_cache_hits')
+        with self._lock:
+            self.hits += 1
+            entry = self._memory.get(key)
+            if entry is not None:
+                self.bytes_saved += entry[3]
+            self._conn.execute('UPDATE responses SET last_used = ? WHERE key = ?', (now, key))
+            self._conn.commit()
+
+    def store(self, key, response, had_entry, now=None):
+        """Keep a full (200) response, if it carries an ETag."""
+        now = now if now is not None else time.time()
+        metrics.incr('response_cache_changed' if had_entry else 'response_cache_misses')
+        with self._lock:
+            if had_entry:
+                self.changed += 1
+            else:
+                self.misses += 1
+        etag = response.get('etag') if isinstance(response, dict) else None
+        if not etag:
+            return
+        body = json.dumps(response, ensure_ascii=False, separators=(',', ':'))
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO responses (key, etag, body, stored_at, last_used) VALUES (?, ?, ?, ?, ?)',
+                (key, etag, body, now, now)
+            )
+            self._conn.commit()
+        self._remember(key, (etag, response, now, len(body)))
+
+    def prune(self, now=None):
+        """Evict entries past max_age_days, then least recently used beyond max_entries."""
+        now = now if now is not None else time.time()
+        with self._lock:
+            deleted = self._conn.execute(
+                'DELETE FROM responses WHERE stored_at < ?', (now - self.max_age_days * 86400,)
+            ).rowcount
+            deleted += self._conn.execute('''
+                DELETE FROM responses WHERE key NOT IN (
+                    SELECT key FROM responses ORDER BY last_used DESC LIMIT ?
+                )
+            ''', (self.max_entries,)).rowcount
+            self._conn.commit()
+        return deleted
+
+    def summary(self):
+        return (f"Response cache: {self.hits} not modified, {self.changed} changed, "
+                f"{self.misses} misses ({self.bytes_saved / 1024:.0f} KB not downloaded)")
+
+    def close(self):
+        self.prune()
+        self._conn.close()
@@ -0,0 +1,181 @@
+"""
+Sharded check cycles: the fetch stage of many targets spread over worker
+processes.
+
+With system.shards > 1 (or --shards N), a check cycle partitions its
+targets round-robin into shards and runs the fetch of each shard in a
+ProcessPoolExecutor worker:
+- every worker process keeps its own YouTubeClient (and response cache)
+- every shard gets its own QuotaScheduler, a slice of the run budget in
+  proportion to the priority of its targets
+
+A worker returns the Batches of its targets. The main process stays the
+only DB writer:
+- it reads the channel state and tracked videos up front
+- it runs every target through the cycle's single Pipeline, in priority
+  order, so max_posts_per_run is one post budget across all shards
+- it charges the quota used by the shards to the run
+
+Fetching (HTTP requests, JSON parsing, building VideoStats) is the part
+of full-scan and init runs that grows with the number of channels; it
+runs on all cores. The batches of a shard are held in memory until the
+main process gets to its targets.
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple, Optional
+
+import metrics
+from pipeline import TargetFetch
+from quota import QuotaScheduler
+from response_cache import ResponseCache
+from target_plan import compile_plans
+from youtube_client import YouTubeClient, VideoStats, VideoStatsCache
+
+
+class TargetResult(NamedTuple):
+    """What a TargetFetch left behind in the worker (see TargetFetch)."""
+    batches: list
+    uploads_playlist_id: Optional[str]
+    newest: Optional[VideoStats]
+    fetched: int
+    tracked_ids: list
+    quota_skipped: int
+
+
+class ShardResult(NamedTuple):
+    targets: list  # TargetResult per job, in order
+    usage: dict    # {(day, call_type): units}
+    calls: dict    # {call_type: count}
+    metrics: dict  # metrics snapshot() of the worker
+
+
+def create_pool(shards):
+    """
+    Worker processes for `shards` shards. Spawned rather than forked: the
+    main process has DB connections and outbox threads a fork would copy.
+    """
+    return ProcessPoolExecutor(max_workers=shards, mp_context=multiprocessing.get_context('spawn'))
+
+
+def partition(items, shards):
+    """Split items round-robin (the plans are sorted by priority, so every shard gets a mix)."""
+    return [items[k::shards] for k in range(shards) if items[k::shards]]
+
+
+def quota_slices(quota, parts):
+    """Units of the run budget per part, proportional to the priority of its targets."""
+    weights = [sum(max(plan.priority, 0.0) for _, plan, _, _ in part) for part in parts]
+    total = sum(weights)
+    if total <= 0:
+        return [quota.run_remaining // len(parts)] * len(parts)
+    return [int(quota.run_remaining * weight / total) for weight in weights]
+
+
+def start(pool, shards, config, jobs, quota, full_scan):
+    """
+    Submit the fetches of the cycle to the pool.
+    jobs: [(plan, channel_state, tracked_ids)] for the plans of
+          compile_plans(config), in that order (the workers rebuild the
+          plans from the config and find them by position)
+    Returns a ShardFetch per job, in the same order.
+    """
+    parts = partition([(i, *job) for i, job in enumerate(jobs)], shards)
+    fetches = [None] * len(jobs)
+    for part, units in zip(parts, quota_slices(quota, parts)):
+        work = [(i, channel_state, tracked_ids) for i, _, channel_state, tracked_ids in part]
+        shard = Shard(pool.submit(run_shard, config, work, units, full_scan), quota)
+        for position, (i, plan, _, _) in enumerate(part):
+            fetches[i] = ShardFetch(plan, shard, position)
+    return fetches
+
+
+class Shard:
+    """A submitted shard. Its quota usage and metrics are merged on first result()."""
+    def __init__(self, future, quota):
+        self.future = future
+        self.quota = quota
+        self._result = None
+
+    def result(self):
+        if self._result is None:
+            result = self.future.result()
+            self.quota.add_usage(result.usage, result.calls)
+            metrics.REGISTRY.merge(result.metrics)
+            self._result = result
+        return self._result
+
+    def cancel(self):
+        self.future.cancel()
+
+
+class ShardFetch:
+    """
+    Stands in for a target's TargetFetch in the main process: batches()
+    waits for the target's shard, then sets the same attributes and
+    yields the batches the worker fetched.
+    """
+    def __init__(self, plan, shard, position):
+        self.plan = plan
+        self.shard = shard
+        self.position = position
+        self.uploads_playlist_id = None
+        self.newest = None
+        self.fetched = 0
+        self.tracked_ids = []
+        self.quota_skipped = 0
+
+    def batches(self):
+        result = self.shard.result().targets[self.position]
+        self.uploads_playlist_id = result.uploads_playlist_id
+        self.newest = result.newest
+        self.fetched = result.fetched
+        self.tracked_ids = result.tracked_ids
+        self.quota_skipped = result.quota_skipped
+        yield from result.batches
+
+    def cancel(self):
+        self.shard.cancel()
+
+
+# --- worker process ---
+
+# The worker process's YouTubeClient, kept across cycles: (transport settings, client)
+_client = None
+
+
+def _worker_client(config):
+    global _client
+    transport = config.get('system', {}).get('youtube_transport', {})
+    settings = (transport.get('pooled', True), transport.get('batch_requests', True))
+    if _client is None or _client[0] != settings:
+        if _client is not None:
+            _client[1].close()
+        client = YouTubeClient(os.getenv("YOUTUBE_API_KEY"), pooled=settings[0], batch_requests=settings[1])
+        client.response_cache = ResponseCache.from_config(config)
+        _client = (settings, client)
+    return _client[1]
+
+
+def run_shard(config, work, quota_units, full_scan):
+    """
+    Worker process: fetch the targets of one shard, in order.
+    work: [(index in compile_plans(config), channel_state, tracked_ids)]
+    Never touches the DB.
+    """
+    metrics.reset()
+    plans = compile_plans(config)
+    client = _worker_client(config)
+    opts = config.get('system', {}).get('quota', {})
+    quota = QuotaScheduler(daily_limit=opts.get('daily_limit', 10000), run_budget=quota_units)
+    quota.plan([plans[i].target for i, _, _ in work])
+    client.quota = quota
+    stats_cache = VideoStatsCache(client)
+    targets = []
+    for i, channel_state, tracked_ids in work:
+        fetch = TargetFetch(plans[i], client, stats_cache, channel_state, tracked_ids, full_scan)
+        batches = list(fetch.batches())
+        targets.append(TargetResult(batches, fetch.uploads_playlist_id, fetch.newest, fetch.fetched,
+                                    fetch.tracked_ids, fetch.quota_skipped))
+    return ShardResult(targets, quota.take_usage(), dict(quota.calls), metrics.REGISTRY.snapshot())
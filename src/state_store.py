@@ -0,0 +1,393 @@
+"""
+Git-friendly persistence of the DB as compressed snapshot and delta files.
+
+The workflow used to commit db/mv_data.db, a binary that is rewritten on
+every run. Instead, the store directory (db/state/) holds:
+
+    manifest.json              current sequence number, snapshot and deltas
+    snapshot-000012.jsonl.gz   every row of the exported tables
+    delta-000013.jsonl.gz      rows changed / deleted by one run
+    ...
+
+Each file is gzip-compressed JSON lines. For every table, a header line
+{"table", "columns", "key"} is followed by its rows sorted by primary
+key: ["+", value, ...] for an inserted or updated row and ["-", key, ...]
+for a deleted one. A run therefore only adds one small delta file.
+Once snapshot_every deltas have piled up (or they outgrow the snapshot),
+they are folded into a fresh snapshot and removed.
+
+restore() rebuilds the DB from the snapshot plus its deltas when the DB
+is missing or older than the store. export() takes a copy of the DB
+(db_path + '.next'; outbox dispatchers may keep writing to the DB), diffs
+it against the copy kept from the last restore/export (db_path + '.base')
+with SQL EXCEPT queries, writes what changed and keeps the new copy as
+the next baseline. The DB records the sequence number it matches in its
+state_meta table.
+
+    python src/state_store.py export|restore|snapshot|verify [--db db/mv_data.db] [--store db/state]
+"""
+import contextlib
+import gzip
+import io
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import time
+
+from db_manager import DatabaseManager
+
+# Exported tables and their primary keys (the rest, e.g. state_meta, stays local)
+TABLES = (
+    ('videos', ('video_id',)),
+    ('post_history', ('id',)),
+    ('view_snapshots', ('video_id', 'ts')),
+    ('api_quota_usage', ('day', 'call_type')),
+    ('channel_state', ('channel_id',)),
+    ('post_outbox', ('id',)),
+)
+FORMAT_VERSION = 1
+_INSERT_CHUNK = 5000
+
+
+class StateStore:
+    def __init__(self, path, snapshot_every=28):
+        self.path = path
+        self.snapshot_every = snapshot_every
+
+    @classmethod
+    def from_config(cls, base_dir, config):
+        """The store configured in system.state_store, or None if disabled."""
+        settings = config.get('system', {}).get('state_store', {})
+        if not settings.get('enabled', False):
+            return None
+        return cls(os.path.join(base_dir, settings.get('path', 'db/state')),
+                   snapshot_every=settings.get('snapshot_every', 28))
+
+    # --- manifest ---
+
+    def manifest(self):
+        try:
+            with open(os.path.join(self.path, 'manifest.json'), encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _write_manifest(self, manifest):
+        path = os.path.join(self.path, 'manifest.json')
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=1)
+            f.write('\n')
+        os.replace(path + '.tmp', path)
+
+    # --- restore ---
+
+    def restore(self, db_path):
+        """
+        Rebuild the DB from the store when it is missing or older than the
+        store. A DB that matches the store, or has changes not exported yet
+        (a newer sequence), is kept. Returns the number of rows loaded, or
+        None if nothing was done.
+        """
+        manifest = self.manifest()
+        if manifest is None:
+            return None
+        if os.path.exists(db_path):
+            seq = db_sequence(db_path)
+            if seq is not None and seq >= manifest['seq']:
+                return None
+        tmp = db_path + '.restore'
+        _remove_db(tmp)
+        rows = self._build(tmp, manifest)
+        _remove_db(db_path)
+        os.replace(tmp, db_path)
+        shutil.copyfile(db_path, db_path + '.base')
+        return rows
+
+    def _build(self, db_path, manifest):
+        """Create a DB at db_path holding the store's state. Returns the row count."""
+        # The schema comes from DatabaseManager (its per-migration messages are noise here)
+        _remove_db(db_path)
+        with contextlib.redirect_stdout(io.StringIO()):
+            DatabaseManager(db_path).close()
+        conn = sqlite3.connect(db_path)
+        try:
+            conn.execute('PRAGMA synchronous=OFF')
+            rows = 0
+            for name in [manifest['snapshot']] + manifest['deltas']:
+                rows += _apply(conn, os.path.join(self.path, name))
+            _set_sequence(conn, manifest['seq'])
+            conn.commit()
+            conn.execute('PRAGMA journal_mode=DELETE')
+        finally:
+            conn.close()
+        return rows
+
+    # --- export ---
+
+    def export(self, db_path):
+        """
+        Write what changed in the DB since the last restore/export.
+        Returns a short description of what was written.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        with _copy(db_path) as copy:
+            return self._export(db_path, copy)
+
+    def _export(self, db_path, copy):
+        manifest = self.manifest()
+        if manifest is None:
+            # First export: the whole DB becomes the initial snapshot
+            manifest = {'format': FORMAT_VERSION, 'seq': 0, 'snapshot': None, 'deltas': []}
+            return self._snapshot(db_path, copy, manifest)
+
+        base_path = db_path + '.base'
+        rebuilt = None
+        if not os.path.exists(base_path) or db_sequence(base_path) != manifest['seq']:
+            # No usable baseline (e.g. a DB that was never restored): rebuild one
+            rebuilt = db_path + '.rebuild'
+            self._build(rebuilt, manifest)
+            base_path = rebuilt
+        try:
+            conn = sqlite3.connect(copy)
+            try:
+                conn.execute('ATTACH DATABASE ? AS base', (base_path,))
+                sections = [_diff(conn, table, key) for table, key in TABLES]
+                conn.execute('DETACH DATABASE base')
+            finally:
+                conn.close()
+        finally:
+            if rebuilt:
+                _remove_db(rebuilt)
+
+        changed = sum(len(rows) for _, rows in sections)
+        if not changed:
+            self._mark(db_path, copy, manifest['seq'])
+            return "no changes"
+        seq = manifest['seq'] + 1
+        name = f"delta-{seq:06d}.jsonl.gz"
+        size = _write(os.path.join(self.path, name), sections)
+        manifest = dict(manifest, seq=seq, deltas=manifest['deltas'] + [name])
+        if self._should_compact(manifest):
+            return self._snapshot(db_path, copy, manifest)
+        self._write_manifest(manifest)
+        self._mark(db_path, copy, seq)
+        return f"{name}: {changed} rows, {size / 1024:.1f} KB"
+
+    def snapshot(self, db_path):
+        """Fold the DB into a new snapshot, replacing the current one and its deltas."""
+        os.makedirs(self.path, exist_ok=True)
+        manifest = self.manifest() or {'format': FORMAT_VERSION, 'seq': 0, 'snapshot': None, 'deltas': []}
+        with _copy(db_path) as copy:
+            return self._snapshot(db_path, copy, dict(manifest, seq=manifest['seq'] + 1))
+
+    def _should_compact(self, manifest):
+        if len(manifest['deltas']) >= self.snapshot_every:
+            return True
+        sizes = [os.path.getsize(os.path.join(self.path, name)) for name in manifest['deltas']]
+        return sum(sizes) > os.path.getsize(os.path.join(self.path, manifest['snapshot']))
+
+    def _snapshot(self, db_path, copy, manifest):
+        seq = max(manifest['seq'], 1)
+        name = f"snapshot-{seq:06d}.jsonl.gz"
+        conn = sqlite3.connect(copy)
+        try:
+            sections = [_dump(conn, table, key) for table, key in TABLES]
+        finally:
+            conn.close()
+        size = _write(os.path.join(self.path, name), sections)
+        old = [manifest['snapshot']] + manifest['deltas']
+        self._write_manifest({'format': FORMAT_VERSION, 'seq': seq, 'snapshot': name, 'deltas': []})
+        for stale in old:
+            if stale and stale != name:
+                try:
+                    os.remove(os.path.join(self.path, stale))
+                except FileNotFoundError:
+                    pass
+        self._mark(db_path, copy, seq)
+        rows = sum(len(rows) for _, rows in sections)
+        return f"{name}: {rows} rows, {size / 1024:.1f} KB"
+
+    def _mark(self, db_path, copy, seq):
+        """
+        Record that the DB matches `seq` and take the exported copy as the
+        next baseline. Writes that landed in the DB after the copy was taken
+        are not in the baseline, so the next export picks them up.
+        """
+        for path in (db_path, copy):
+            conn = sqlite3.connect(path)
+            try:
+                _set_sequence(conn, seq)
+                conn.commit()
+            finally:
+                conn.close()
+        _remove_db(db_path + '.base')
+        os.replace(copy, db_path + '.base')
+
+    def verify(self, db_path):
+        """True if rebuilding from the store gives exactly the DB's exported tables."""
+        manifest = self.manifest()
+        if manifest is None:
+            return False
+        rebuilt = db_path + '.rebuild'
+        try:
+            self._build(rebuilt, manifest)
+            conn = sqlite3.connect(db_path)
+            try:
+                conn.execute('ATTACH DATABASE ? AS base', (rebuilt,))
+                same = all(not rows for _, rows in (_diff(conn, t, k) for t, k in TABLES))
+                conn.execute('DETACH DATABASE base')
+            finally:
+                conn.close()
+            return same
+        finally:
+            _remove_db(rebuilt)
+
+
+def db_sequence(db_path):
+    """The store sequence number a DB file matches (None if unknown)."""
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        row = conn.execute("SELECT value FROM state_meta WHERE key = 'seq'").fetchone()
+        return int(row[0]) if row else None
+    except sqlite3.Error:
+        return None
+    finally:
+        conn.close()
+
+
+@contextlib.contextmanager
+def _copy(db_path):
+    """A consistent copy of the DB (db_path + '.next'), removed afterwards unless kept as the baseline."""
+    path = db_path + '.next'
+    _remove_db(path)
+    conn = sqlite3.connect(db_path)
+    try:
+        copy = sqlite3.connect(path)
+        try:
+            # One backup step: the whole DB as of a single read transaction
+            conn.backup(copy)
+        finally:
+            copy.close()
+    finally:
+        conn.close()
+    try:
+        yield path
+    finally:
+        _remove_db(path)
+
+
+def _set_sequence(conn, seq):
+    conn.execute("INSERT OR REPLACE INTO state_meta (key, value) VALUES ('seq', ?)", (str(seq),))
+
+
+def _columns(conn, schema, table):
+    return [row[1] for row in conn.execute(f'PRAGMA {schema}.table_info({table})')]
+
+
+def _dump(conn, table, key):
+    """(header, rows): every row of the table as '+' entries."""
+    columns = _columns(conn, 'main', table)
+    order = ', '.join(key)
+    rows = [['+', *row] for row in conn.execute(
+        f"SELECT {', '.join(columns)} FROM {table} ORDER BY {order}")]
+    return {'table': table, 'columns': columns, 'key': list(key)}, rows
+
+
+def _diff(conn, table, key):
+    """(header, rows): rows of main that differ from base, then keys only in base (deleted)."""
+    columns = _columns(conn, 'main', table)
+    cols = ', '.join(columns)
+    keys = ', '.join(key)
+    rows = [['+', *row] for row in conn.execute(
+        f"SELECT {cols} FROM main.{table} EXCEPT SELECT {cols} FROM base.{table} ORDER BY {keys}")]
+    rows += [['-', *row] for row in conn.execute(
+        f"SELECT {keys} FROM base.{table} EXCEPT SELECT {keys} FROM main.{table} ORDER BY {keys}")]
+    return {'table': table, 'columns': columns, 'key': list(key)}, rows
+
+
+def _write(path, sections):
+    """Write sections as gzip JSON lines (mtime 0, so equal content gives equal files). Returns the size."""
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=9, mtime=0) as f:
+        for header, rows in sections:
+            if not rows:
+                continue
+            f.write((json.dumps(header, ensure_ascii=False) + '\n').encode('utf-8'))
+            for row in rows:
+                f.write((json.dumps(row, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8'))
+    os.replace(tmp, path)
+    return os.path.getsize(path)
+
+
+def _apply(conn, path):
+    """Apply one snapshot or delta file. Returns the number of entries."""
+    count = 0
+    header = None
+    upserts, deletes = [], []
+
+    def flush():
+        if header is None:
+            return
+        if upserts:
+            conn.executemany(
+                f"INSERT OR REPLACE INTO {header['table']} ({', '.join(header['columns'])}) "
+                f"VALUES ({', '.join('?' * len(header['columns']))})", upserts)
+            upserts.clear()
+        if deletes:
+            conn.executemany(
+                f"DELETE FROM {header['table']} WHERE "
+                + ' AND '.join(f"{k} = ?" for k in header['key']), deletes)
+            deletes.clear()
+
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            entry = json.loads(line)
+            if isinstance(entry, dict):
+                flush()
+                header = entry
+                continue
+            count += 1
+            (upserts if entry[0] == '+' else deletes).append(entry[1:])
+            if len(upserts) + len(deletes) >= _INSERT_CHUNK:
+                flush()
+    flush()
+    return count
+
+
+def _remove_db(path):
+    for suffix in ('', '-wal', '-shm', '-journal'):
+        try:
+            os.remove(path + suffix)
+        except FileNotFoundError:
+            pass
+
+
+if __name__ == "__main__":
+    import argparse
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser(description="Export / restore the DB as snapshot and delta files")
+    parser.add_argument("command", choices=["export", "restore", "snapshot", "verify"])
+    parser.add_argument("--db", default=os.path.join(base_dir, "db", "mv_data.db"))
+    parser.add_argument("--store", default=os.path.join(base_dir, "db", "state"))
+    args = parser.parse_args()
+
+    store = StateStore(args.store)
+    started = time.perf_counter()
+    if args.command != "restore":
+        # Bring an older DB up to the current schema first
+        DatabaseManager(args.db).close()
+    if args.command == "export":
+        print(store.export(args.db))
+    elif args.command == "snapshot":
+        print(store.snapshot(args.db))
+    elif args.command == "restore":
+        rows = store.restore(args.db)
+        print("DB is up to date with the store." if rows is None else f"Restored {rows} rows.")
+    else:
+        ok = store.verify(args.db)
+        print("DB matches the store." if ok else "DB differs from the store.")
+        if not ok:
+            sys.exit(1)
+    print(f"Done in {time.perf_counter() - started:.2f}s")
@@ -0,0 +1,95 @@
+"""
+Per-target plans compiled once from config['targets'].
+
+Everything that used to be recomputed for every video or every run
+(keyword matching, step rule lookup, hashtags and custom_vars) is
+resolved here, so per-video filtering and rendering only do a constant
+amount of work. Plans are immutable; a config reload compiles new ones.
+"""
+import re
+from types import MappingProxyType
+from typing import Any, Mapping, NamedTuple, Optional, Pattern
+
+from milestones import MilestoneEvaluator
+from templates import compile_template
+
+
+def compile_keywords(keywords):
+    """
+    One regex matching any keyword in an already lowercased title.
+    Keywords are lowercased and escaped, so matching is the same as
+    `kw.lower() in title.lower()` for each keyword. Returns None if empty.
+    """
+    keywords = [kw.lower() for kw in keywords if kw]
+    if not keywords:
+        return None
+    # Longest first so overlapping keywords don't shadow each other
+    keywords.sort(key=len, reverse=True)
+    return re.compile('|'.join(re.escape(kw) for kw in keywords))
+
+
+class TargetPlan(NamedTuple):
+    target: Mapping[str, Any]        # the raw config entry (read-only)
+    artist_name: str
+    account_id: str
+    channel_id: str
+    priority: float
+    hashtags: str
+    custom_vars: Mapping[str, Any]
+    include_pattern: Optional[Pattern]
+    exclude_pattern: Optional[Pattern]
+    evaluator: MilestoneEvaluator
+    templates: Mapping[str, tuple]   # action kind -> CompiledTemplates with static parts bound
+
+    @classmethod
+    def compile(cls, target, templates):
+        """Build the plan of one config['targets'] entry."""
+        artist_name = target['artist_name']
+        hashtags = " ".join(target.get('hashtags', []))
+        
+        # Custom variables for templates
+        custom_vars = dict(target.get('custom_vars') or {})
+        custom_vars.setdefault('fan_name', 'ファン')
+        custom_vars.setdefault('oshi_mark', '✨')
+        custom_vars.setdefault('cheer_msg', f"{artist_name}最高！")
+        
+        static_values = {'artist_name': artist_name, 'hashtags': hashtags, **custom_vars}
+        rendered = {}
+        for kind, template_or_list in (templates or {}).items():
+            template_list = template_or_list if isinstance(template_or_list, list) else [template_or_list]
+            rendered[kind] = tuple(compile_template(t).bind(static_values) for t in template_list)
+        
+        return cls(
+            target=MappingProxyType(target),
+            artist_name=artist_name,
+            account_id=target.get('account_id', 'DEFAULT'),
+            channel_id=target['channel_id'],
+            priority=target.get('priority', 1),
+            hashtags=hashtags,
+            custom_vars=MappingProxyType(custom_vars),
+            include_pattern=compile_keywords(target.get('title_keywords', [])),
+            exclude_pattern=compile_keywords(target.get('exclude_keywords', [])),  # 除外キーワード
+            evaluator=MilestoneEvaluator.for_target(target),
+            templates=MappingProxyType(rendered),
+        )
+
+    def matches_title(self, title):
+        """Title keyword filter: must match an include keyword (if any) and no exclude keyword."""
+        lowered = title.lower()
+        if self.include_pattern and not self.include_pattern.search(lowered):
+            return False
+        # Exclude videos matching exclude_keywords (e.g. 鑑賞会)
+        if self.exclude_pattern and self.exclude_pattern.search(lowered):
+            return False
+        return True
+
+    def is_relevant(self, video):
+        """Keyword filter plus the shorts filter (less than 60 seconds typically)."""
+        return video.duration_seconds >= 60 and self.matches_title(video.title)
+
+
+def compile_plans(config):
+    """Plans for all targets, highest 'priority' first (stable for equal priorities)."""
+    templates = config.get('templates', {})
+    plans = [TargetPlan.compile(t, templates) for t in config.get('targets', [])]
+    return sorted(plans, key=lambda p: -p.priority)
@@ -0,0 +1,144 @@
+"""
+Post message templates compiled once into literal / placeholder segments.
+
+A template such as "「{video_title}」が{views}回再生を突破" is parsed into
+literals ["「", "」が", "回再生を突破"] and keys ["video_title", "views"], so
+rendering is a single join instead of one str.replace per data key.
+Placeholders without a value are left as written, like str.replace did.
+"""
+import random
+import re
+from functools import lru_cache
+
+_PLACEHOLDER = re.compile(r'\{([^{}]+)\}')
+_MISSING = object()
+
+
+class CompiledTemplate:
+    __slots__ = ('source', 'literals', 'keys')
+
+    def __init__(self, source, literals=None, keys=None):
+        self.source = source
+        if literals is None:
+            parts = _PLACEHOLDER.split(source)
+            # split() alternates literal, key, literal, ..., literal
+            literals, keys = parts[0::2], parts[1::2]
+        self.literals = tuple(literals)
+        self.keys = tuple(keys)
+
+    def render(self, data):
+        """Fill the placeholders from `data`; unknown keys stay as {key}."""
+        literals = self.literals
+        out = [literals[0]]
+        for i, key in enumerate(self.keys, 1):
+            value = data.get(key, _MISSING)
+            out.append("{" + key + "}" if value is _MISSING else str(value))
+            out.append(literals[i])
+        return "".join(out)
+
+    def bind(self, values):
+        """
+        A new template with the given placeholders filled in for good
+        (e.g. artist_name and hashtags, which never change for a target).
+        """
+        literals = [self.literals[0]]
+        keys = []
+        for i, key in enumerate(self.keys, 1):
+            if key in values:
+                literals[-1] += str(values[key]) + self.literals[i]
+            else:
+                keys.append(key)
+                literals.append(self.literals[i])
+        return CompiledTemplate(self.render(values), literals, keys)
+
+    def __repr__(self):
+        return f"CompiledTemplate({self.source!r})"
+
+
+@lru_cache(maxsize=256)
+def compile_template(source):
+    """Parse a template string (cached: config templates are few and reused)."""
+    return CompiledTemplate(source)
+
+
+@lru_cache(maxsize=4096)
+def format_number(num):
+    """
+    Format number in Japanese style for better impact.
+    Examples:
+        100000000 -> "1億"
+        50000000 -> "5000万"
+        1000000 -> "100万"
+        500000 -> "50万"
+        10000 -> "1万"
+        1234 -> "1,234"
+    Memoized: milestone values and goals repeat across videos and cycles.
+    """
+    if num >= 100000000:  # 1億以上
+        oku = num // 100000000
+        remainder = num % 100000000
+        if remainder == 0:
+            return f"{oku}億"
+        elif remainder >= 10000000:  # 1000万以上の端数
+            man = remainder // 10000
+            return f"{oku}億{man}万"
+        else:
+            return f"{oku}億"
+    elif num >= 10000:  # 1万以上
+        man = num // 10000
+        return f"{man}万"
+    else:
+        return "{:,}".format(num)
+
+
+def create_message(template_or_list, data):
+    """
+    Create a message by filling data into the template.
+    If a list of templates is provided, select one randomly.
+    Accepts raw strings or CompiledTemplates.
+    """
+    if isinstance(template_or_list, (list, tuple)):
+        template = random.choice(template_or_list)
+    else:
+        template = template_or_list
+    if isinstance(template, str):
+        template = compile_template(template)
+    return template.render(data)
+
+
+def event_values(event, title):
+    """The per-post placeholder values of a MilestoneEvent."""
+    video_url = f"https://www.youtube.com/watch?v={event.video_id}"
+    if event.is_support:
+        return {
+            "video_title": title,
+            "target_views": format_number(event.milestone_value),
+            "current_views": format_number(event.view_count),
+            "remaining": format_number(event.remaining),
+            "video_url": video_url,
+        }
+    return {
+        "video_title": title,
+        "views": format_number(event.milestone_value),
+        "next_goal": format_number(event.next_goal),
+        "video_url": video_url,
+    }
+
+
+def render_events(events, titles, templates, choice=random.choice):
+    """
+    Render the messages of a batch of MilestoneEvents in one pass.
+    `templates` maps 'achieved' / 'support' to a sequence of
+    CompiledTemplates (see TargetPlan.templates); `titles` maps video ID to
+    title. Returns the messages in event order.
+    """
+    achieved = templates.get('achieved')
+    support = templates.get('support')
+    messages = []
+    for event in events:
+        pool = support if event.is_support else achieved
+        if not pool:
+            raise KeyError('support' if event.is_support else 'achieved')
+        values = event_values(event, titles[event.video_id])
+        messages.append(choice(pool).render(values))
+    return messages
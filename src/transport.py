@@ -0,0 +1,50 @@
+"""
+HTTP transport for googleapiclient over a pooled requests.Session.
+
+googleapiclient only needs an object with httplib2.Http's request() method.
+SessionHttp provides it on top of requests, whose connection pool keeps
+connections to the API alive and, unlike httplib2.Http, is safe to share
+between threads; one service object can then serve every worker.
+"""
+import httplib2
+import requests
+from requests.adapters import HTTPAdapter
+
+YOUTUBE_API_HOST = "https://youtube.googleapis.com"
+
+# Headers describing the wire encoding; requests has already decoded the body
+_DROPPED_HEADERS = ('content-encoding', 'content-length', 'transfer-encoding')
+
+
+class SessionHttp:
+    """
+    httplib2.Http-compatible request() over a keep-alive connection pool.
+    api_host redirects calls for YOUTUBE_API_HOST (e.g. to a local stub).
+    """
+    def __init__(self, api_host=None, pool_size=16, timeout=60):
+        self.api_host = api_host.rstrip("/") if api_host else None
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.request_count = 0
+
+    def request(self, uri, method="GET", body=None, headers=None,
+                redirections=httplib2.DEFAULT_MAX_REDIRECTS, connection_type=None):
+        if self.api_host and uri.startswith(YOUTUBE_API_HOST):
+            uri = self.api_host + uri[len(YOUTUBE_API_HOST):]
+        self.request_count += 1
+        r = self.session.request(
+            method, uri, data=body, headers=headers, timeout=self.timeout,
+            allow_redirects=redirections > 0
+        )
+        info = {k.lower(): v for k, v in r.headers.items() if k.lower() not in _DROPPED_HEADERS}
+        info['status'] = str(r.status_code)
+        response = httplib2.Response(info)
+        if r.reason:
+            response.reason = r.reason
+        return response, r.content
+
+    def close(self):
+        self.session.close()
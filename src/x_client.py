@@ -1,29 +1,114 @@
+import threading
+
+import requests
 import tweepy
+from requests.adapters import HTTPAdapter
+
+from outbox import PostError
+
+X_API_HOST = "https://api.twitter.com"
+
+
+class _HostSession(requests.Session):
+    """Session that sends requests for the X API host to another host (e.g. a local fake)."""
+    def __init__(self, api_host):
+        super().__init__()
+        self.api_host = api_host.rstrip("/")
+
+    def request(self, method, url, *args, **kwargs):
+        if url.startswith(X_API_HOST):
+            url = self.api_host + url[len(X_API_HOST):]
+        return super().request(method, url, *args, **kwargs)
+
 
 class XClient:
-    def __init__(self, consumer_key, consumer_secret, access_token, access_token_secret):
-        self.auth = tweepy.OAuthHandler(consumer_key, consumer_secret)
-        self.auth.set_access_token(access_token, access_token_secret)
-        self.api = tweepy.API(self.auth)
+    def __init__(self, consumer_key, consumer_secret, access_token, access_token_secret,
+                 api_host=None, session=None):
+        self._credentials = (consumer_key, consumer_secret, access_token, access_token_secret)
+        self._api = None
         self.client = tweepy.Client(
             consumer_key=consumer_key,
             consumer_secret=consumer_secret,
             access_token=access_token,
             access_token_secret=access_token_secret
         )
+        if session is None and api_host:
+            session = _HostSession(api_host)
+        if session is not None:
+            # Shared keep-alive connections (see XClientPool)
+            self.client.session = session
+
+    @property
+    def api(self):
+        """v1.1 API object, built on first use (posting only needs the v2 client)."""
+        if self._api is None:
+            consumer_key, consumer_secret, access_token, access_token_secret = self._credentials
+            auth = tweepy.OAuthHandler(consumer_key, consumer_secret)
+            auth.set_access_token(access_token, access_token_secret)
+            self._api = tweepy.API(auth)
+        return self._api
+
+    def send_tweet(self, text):
+        """
+        Post a tweet using Tweepy Client (API v2) and return its ID.
+        Raises PostError; rate limits, server and network errors are retryable.
+        """
+        try:
+            response = self.client.create_tweet(text=text)
+        except tweepy.TooManyRequests as e:
+            raise PostError(str(e), status=429, retry_at=getattr(e, 'reset_time', None)) from e
+        except tweepy.HTTPException as e:
+            raise PostError(str(e), status=e.response.status_code) from e
+        except requests.RequestException as e:
+            raise PostError(str(e)) from e
+        return str((response.data or {}).get('id', ''))
 
     def post_tweet(self, text):
         """
         Post a tweet using Tweepy Client (API v2).
         """
         try:
-            response = self.client.create_tweet(text=text)
+            response = self.send_tweet(text)
             print(f"Tweet posted successfully: {response}")
             return True
         except Exception as e:
             print(f"Error posting tweet: {e}")
             return False
 
+class XClientPool:
+    """
+    One XClient per account_id, built on first use and kept for the life of
+    the pool. All clients share one HTTP session, so connections to the X API
+    stay alive across posts and accounts (OAuth is signed per request).
+    
+    credentials_for(account_id) returns the four credentials, or None.
+    """
+    def __init__(self, credentials_for, api_host=None):
+        self.credentials_for = credentials_for
+        self.session = _HostSession(api_host) if api_host else requests.Session()
+        # One kept-alive connection per concurrently posting account
+        adapter = HTTPAdapter(pool_maxsize=32)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.clients = {}
+        self._lock = threading.Lock()
+
+    def get(self, account_id):
+        with self._lock:
+            client = self.clients.get(account_id)
+            if client is None:
+                credentials = self.credentials_for(account_id)
+                if not credentials:
+                    raise RuntimeError(f"X credentials not found for {account_id}")
+                client = XClient(*credentials, session=self.session)
+                self.clients[account_id] = client
+            return client
+
+    def close(self):
+        with self._lock:
+            self.clients = {}
+            self.session.close()
+
 if __name__ == "__main__":
     # Test stub
     pass
@@ -1,116 +1,497 @@
+import json
+import os
+import threading
+from typing import NamedTuple, Optional
+
 import isodate
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
+
+import metrics
+from quota import QuotaExceeded
+from response_cache import request_key
+
+# googleapiclient is imported lazily (it takes ~0.3s to import), see build_youtube_service()
+
+DISCOVERY_URL = 'https://www.googleapis.com/discovery/v1/apis/youtube/v3/rest'
+DISCOVERY_CACHE_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.cache', 'discovery', 'youtube.v3.json'
+)
+
+_discovery_lock = threading.Lock()
+_discovery_doc = None
+
+def load_discovery_document(cache_path=DISCOVERY_CACHE_PATH):
+    """
+    The YouTube v3 discovery document, parsed once per process.
+    Sources, in order: the copy bundled with google-api-python-client, the
+    local cache file, and finally a one-time download into the cache file.
+    """
+    global _discovery_doc
+    with _discovery_lock:
+        if _discovery_doc is not None:
+            return _discovery_doc
+        
+        text = None
+        try:
+            from googleapiclient.discovery_cache import get_static_doc
+            text = get_static_doc('youtube', 'v3')
+        except ImportError:  # google-api-python-client < 2.0 has no bundled docs
+            pass
+        
+        if text is None and os.path.exists(cache_path):
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                text = f.read()
+        
+        if text is None:
+            import httplib2
+            resp, content = httplib2.Http().request(DISCOVERY_URL)
+            if resp.status != 200:
+                raise RuntimeError(f"Failed to download discovery document: HTTP {resp.status}")
+            text = content.decode('utf-8')
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            with open(cache_path, 'w', encoding='utf-8') as f:
+                f.write(text)
+        
+        _discovery_doc = json.loads(text)
+        return _discovery_doc
+
+def build_youtube_service(api_key, http=None, api_host=None):
+    """
+    Build a YouTube Data API service from the cached discovery document (no network).
+    http: transport to use instead of a new httplib2.Http (see transport.SessionHttp)
+    api_host: send regular calls to this host (the batch endpoint is not redirected)
+    """
+    from googleapiclient.discovery import build_from_document
+    client_options = {'api_endpoint': api_host.rstrip('/') + '/youtube/v3/'} if api_host else None
+    return build_from_document(load_discovery_document(), developerKey=api_key, http=http,
+                               client_options=client_options)
+
+def parse_duration(duration_iso):
+    """Whole seconds of an ISO 8601 duration (0 if it cannot be parsed)."""
+    try:
+        return int(isodate.parse_duration(duration_iso).total_seconds())
+    except Exception:
+        return 0
+
+
+class VideoStats(NamedTuple):
+    """
+    The stats of one video the bot keeps: what VideoStatsCache holds per
+    video and what iter_channel_videos yields. published_at is only known
+    for uploads from the playlist.
+    """
+    id: str
+    title: str
+    view_count: int
+    duration_seconds: int
+    published_at: Optional[str] = None
+
+    @classmethod
+    def from_item(cls, item):
+        """Build from a videos.list item (parts statistics, contentDetails and optionally snippet)."""
+        snippet = item.get('snippet', {})
+        return cls(
+            item['id'],
+            snippet.get('title', ''),
+            int(item.get('statistics', {}).get('viewCount', 0)),
+            parse_duration(item.get('contentDetails', {}).get('duration', 'PT0S')),
+            snippet.get('publishedAt'),
+        )
+
+
+class ChannelPageError(Exception):
+    """Fetching page `page` of a channel's uploads failed (page 0: resolving the playlist)."""
+    def __init__(self, channel_id, page, cause):
+        super().__init__(f"{channel_id} page {page}: {cause}")
+        self.channel_id = channel_id
+        self.page = page
+        self.cause = cause
+
+
+class VideoStatsCache:
+    """
+    Per-run cache of videos.list results, kept as VideoStats records.
+    Every pass of a run asks the cache for the videos it needs; IDs are
+    deduplicated and only the ones not fetched yet are requested, packed
+    into full batches of 50. Each video is fetched at most once per run.
+    """
+    PART = 'statistics,snippet,contentDetails'
+    BATCH_SIZE = 50
+    MAX_BATCH_CALLS = 20  # videos.list calls sent per batch HTTP request
+
+    def __init__(self, client, executor=None):
+        """
+        executor: optional thread pool used to fetch the batches of one
+                  prefetch() call in parallel
+        """
+        self.client = client
+        self.executor = executor
+        self._items = {}  # video_id -> VideoStats, or None if the API did not return it
+        self._lock = threading.Lock()
+        self.api_calls = 0
+        self.round_trips = 0  # HTTP requests; less than api_calls when batched
+
+    def __contains__(self, video_id):
+        return video_id in self._items
+
+    def get(self, video_id):
+        return self._items.get(video_id)
+
+    def prefetch(self, video_ids):
+        """
+        Fetch every ID that is not cached yet.
+        Raises QuotaExceeded after caching whatever was fetched before the
+        budget ran out.
+        """
+        missing = []
+        seen = set()
+        for vid in video_ids:
+            if vid not in self._items and vid not in seen:
+                seen.add(vid)
+                missing.append(vid)
+        chunks = [missing[i:i + self.BATCH_SIZE] for i in range(0, len(missing), self.BATCH_SIZE)]
+        if getattr(self.client, 'batch_requests', False) and len(chunks) > 1:
+            # Several videos.list calls per HTTP round trip
+            jobs = [chunks[i:i + self.MAX_BATCH_CALLS] for i in range(0, len(chunks), self.MAX_BATCH_CALLS)]
+            fetch_job = self._fetch_batch
+        else:
+            jobs = chunks
+            fetch_job = self._fetch_chunk
+        if self.executor and len(jobs) > 1:
+            # Worker threads charge the quota to the caller's target
+            quota = self.client.quota
+            target = quota.current_target if quota else None
+
+            def fetch(job):
+                if quota:
+                    with quota.use_target(target):
+                        return fetch_job(job)
+                return fetch_job(job)
+
+            # Consuming the results re-raises the first error (e.g. QuotaExceeded)
+            for _ in self.executor.map(fetch, jobs):
+                pass
+        else:
+            for job in jobs:
+                fetch_job(job)
+        return len(missing)
+
+    def _store(self, chunk, items):
+        with self._lock:
+            self.api_calls += 1
+            for vid in chunk:
+                self._items[vid] = None
+            for item in items:
+                self._items[item['id']] = VideoStats.from_item(item)
+
+    def _fetch_chunk(self, chunk):
+        items = self.client.get_video_details(chunk, part=self.PART)
+        self.round_trips += 1
+        self._store(chunk, items)
+
+    def _fetch_batch(self, chunks):
+        """Fetch several chunks with one batch request; raises the first per-chunk error after storing the rest."""
+        results = self.client.get_video_details_batch(chunks, part=self.PART)
+        self.round_trips += 1
+        error = None
+        for chunk, result in zip(chunks, results):
+            if isinstance(result, Exception):
+                error = error or result
+            else:
+                self._store(chunk, result)
+        if error:
+            raise error
+
 
 class YouTubeClient:
-    def __init__(self, api_key):
-        self.youtube = build('youtube', 'v3', developerKey=api_key)
+    def __init__(self, api_key, quota=None, youtube=None, pooled=True, batch_requests=True, api_host=None):
+        """
+        quota: optional QuotaScheduler charged for every API call
+        youtube: prebuilt service object (e.g. a fake API for tests)
+        pooled: share one service over a keep-alive connection pool
+                (transport.SessionHttp) instead of one httplib2 service per thread
+        batch_requests: send several videos.list calls per HTTP request
+        api_host: send API calls to this host instead (e.g. a local stub);
+                  defaults to $YOUTUBE_API_HOST. Batch requests are only
+                  redirected with pooled.
+        """
+        self.api_key = api_key
+        self.quota = quota
+        self.batch_requests = batch_requests
+        self.response_cache = None  # optional ResponseCache for conditional requests
+        self.http = None
+        self.api_host = api_host or os.getenv("YOUTUBE_API_HOST")
+        self._shared_service = youtube
+        self._local = threading.local()
+        if youtube is None and pooled:
+            from transport import SessionHttp
+            self.http = SessionHttp(api_host=self.api_host)
+            self._shared_service = build_youtube_service(api_key, http=self.http)
+        elif youtube is None:
+            self.youtube  # build the main thread's service up front
+
+    def close(self):
+        if self.http:
+            self.http.close()
+
+    @property
+    def youtube(self):
+        """
+        The API service object. httplib2 connections are not thread-safe, so
+        without the pooled transport each thread gets its own service.
+        """
+        if self._shared_service is not None:
+            return self._shared_service
+        service = getattr(self._local, 'service', None)
+        if service is None:
+            service = build_youtube_service(self.api_key, api_host=self.api_host)
+            self._local.service = service
+        return service
+
+    def _execute(self, request, call_type):
+        """Charge the call to the quota scheduler (if any), then execute it."""
+        if self.quota:
+            self.quota.spend(call_type)
+        with metrics.span('youtube.' + call_type):
+            return request.execute()
 
-    def get_channel_videos(self, channel_id, limit=50, full_scan=False):
+    def _execute_conditional(self, request, call_type):
         """
-        Get latest videos from a channel.
-        Note: Searching by channel ID is the easiest way to get uploads.
+        Execute a request whose response rarely changes (uploads playlist
+        pages, channels.list). With a response cache, a cached response is
+        revalidated with If-None-Match and reused on 304 Not Modified.
+        """
+        cache = self.response_cache
+        if cache is None:
+            return self._execute(request, call_type)
+        key = request_key(request.uri)
+        cached = cache.lookup(key)
+        if cached:
+            request.headers['If-None-Match'] = cached[0]
+        try:
+            response = self._execute(request, call_type)
+        except Exception as e:
+            # googleapiclient raises HttpError for any status >= 300
+            if cached and getattr(getattr(e, 'resp', None), 'status', None) == 304:
+                cache.hit(key)
+                return cached[1]
+            raise
+        cache.store(key, response, had_entry=cached is not None)
+        return response
+
+    def get_video_details(self, video_ids, part='statistics,snippet,contentDetails'):
+        """
+        Fetch details for up to 50 video IDs with one videos.list call.
+        Returns the raw API items.
+        """
+        if not video_ids:
+            return []
+        request = self.youtube.videos().list(
+            part=part,
+            id=','.join(video_ids)
+        )
+        response = self._execute(request, 'videos.list')
+        return response.get('items', [])
+
+    def get_video_details_batch(self, chunks, part='statistics,snippet,contentDetails'):
+        """
+        videos.list for several chunks of up to 50 IDs in one HTTP round trip
+        (the API's batch endpoint). Returns one entry per chunk, in order:
+        the chunk's items, or the exception of that chunk (QuotaExceeded for
+        chunks the budget did not cover).
+        """
+        results = [None] * len(chunks)
+        calls = []
+        for i, chunk in enumerate(chunks):
+            try:
+                if self.quota:
+                    self.quota.spend('videos.list')
+            except QuotaExceeded as e:
+                results[i:] = [e] * (len(chunks) - i)
+                break
+            calls.append((i, self.youtube.videos().list(part=part, id=','.join(chunk))))
+        
+        def store(i, response, exception=None):
+            results[i] = exception if exception is not None else response.get('items', [])
+        
+        if len(calls) > 1 and self.batch_requests:
+            batch = self.youtube.new_batch_http_request()
+            for i, request in calls:
+                batch.add(request, request_id=str(i),
+                          callback=lambda request_id, response, exception: store(int(request_id), response, exception))
+            try:
+                with metrics.span('youtube.batch'):
+                    batch.execute()
+                return results
+            except Exception as e:
+                # e.g. the batch endpoint is unavailable: the calls are already
+                # charged, send them one by one (and stop batching)
+                print(f"Batch request failed ({e}); falling back to single requests.")
+                self.batch_requests = False
+        for i, request in calls:
+            try:
+                with metrics.span('youtube.videos.list'):
+                    store(i, request.execute())
+            except Exception as e:
+                store(i, None, e)
+        return results
+
+    def get_uploads_playlist_id(self, channel_id):
+        """Return the channel's uploads playlist ID, or None if the channel does not exist."""
+        request = self.youtube.channels().list(
+            part='contentDetails',
+            id=channel_id
+        )
+        response = self._execute_conditional(request, 'channels.list')
+        
+        if not response.get('items'):
+            return None
+        return response['items'][0]['contentDetails']['relatedPlaylists']['uploads']
+
+    def get_channel_videos(self, channel_id, limit=50, full_scan=False,
+                           uploads_playlist_id=None, since=None, stats_cache=None):
+        """
+        Get latest videos from a channel as a list of VideoStats records
+        (see iter_channel_videos). Errors stop the fetch but keep the videos
+        fetched before them.
         """
         videos = []
         try:
-            # 1. Get Uploads Playlist ID
-            request = self.youtube.channels().list(
-                part='contentDetails',
-                id=channel_id
-            )
-            response = request.execute()
-            
-            if not response.get('items'):
-                print(f"Channel {channel_id} not found.")
-                return []
+            for page in self.iter_channel_videos(channel_id, limit, full_scan,
+                                                 uploads_playlist_id, since, stats_cache):
+                videos.extend(page)
+        except QuotaExceeded as e:
+            print(f"Quota limit reached, stopping fetch: {e}")
+        except ChannelPageError as e:
+            print(f"An error occurred: {e}")
+        return videos
 
-            uploads_playlist_id = response['items'][0]['contentDetails']['relatedPlaylists']['uploads']
+    def iter_channel_videos(self, channel_id, limit=50, full_scan=False,
+                            uploads_playlist_id=None, since=None, stats_cache=None):
+        """
+        Yield the channel's uploads page by page, newest first, as lists of
+        VideoStats records. Each page is yielded as soon as its stats
+        arrive, so callers can process it while the next one is fetched and
+        never hold the whole channel in memory.
+        
+        uploads_playlist_id: cached uploads playlist ID (skips channels.list)
+        since: high-water mark {'video_id', 'published_at'} of the newest video
+               already known. When given (and not full_scan), only newer videos
+               are returned and paging stops at the first known one.
+        stats_cache: VideoStatsCache shared with the rest of the run
+        
+        QuotaExceeded is raised as is; any other error of a page is raised
+        as ChannelPageError after the pages before it were yielded.
+        """
+        # 1. Get Uploads Playlist ID
+        if not uploads_playlist_id:
+            try:
+                uploads_playlist_id = self.get_uploads_playlist_id(channel_id)
+            except QuotaExceeded:
+                raise
+            except Exception as e:
+                raise ChannelPageError(channel_id, 0, e) from e
+        
+        if not uploads_playlist_id:
+            print(f"Channel {channel_id} not found.")
+            return
 
-            # 2. Get Videos from Playlist with Pagination
-            next_page_token = None
-            total_fetched = 0
-            
-            print(f"Fetching videos from playlist: {uploads_playlist_id} (Full Scan: {full_scan})")
+        incremental = bool(since) and not full_scan
 
-            while True:
-                # Decide max results for this batch
-                batch_limit = 50
-                
-                request = self.youtube.playlistItems().list(
-                    part='snippet',
-                    playlistId=uploads_playlist_id,
-                    maxResults=batch_limit,
-                    pageToken=next_page_token
+        # 2. Get Videos from Playlist with Pagination
+        next_page_token = None
+        total_fetched = 0
+        page_number = 0
+        
+        print(f"Fetching videos from playlist: {uploads_playlist_id} "
+              f"(Full Scan: {full_scan}, Incremental: {incremental})")
+
+        while True:
+            page_number += 1
+            try:
+                page, next_page_token, reached_known, fetched = self._fetch_playlist_page(
+                    uploads_playlist_id, next_page_token, since if incremental else None, stats_cache
                 )
-                response = request.execute()
+            except QuotaExceeded:
+                raise
+            except Exception as e:
+                raise ChannelPageError(channel_id, page_number, e) from e
+            if fetched == 0:
+                break
+            if page:
+                yield page
 
-                items = response.get('items', [])
-                if not items:
-                    break
+            total_fetched += fetched
 
-                # Temporary list to hold basic info before fetching details
-                batch_videos = []
-                video_ids = []
-                
-                for item in items:
-                    vid = item['snippet']['resourceId']['videoId']
-                    video_ids.append(vid)
-                    batch_videos.append({
-                        'id': vid,
-                        'title': item['snippet']['title'],
-                        'published_at': item['snippet']['publishedAt']
-                    })
-                
-                # 3. Get Statistics and ContentDetails (Duration)
-                if video_ids:
-                    stats_request = self.youtube.videos().list(
-                        part='statistics,contentDetails',
-                        id=','.join(video_ids)
-                    )
-                    stats_response = stats_request.execute()
-                    
-                    # Create a map for easy lookup
-                    details_map = {item['id']: item for item in stats_response['items']}
-                    
-                    for video in batch_videos:
-                        sid = video['id']
-                        if sid in details_map:
-                            stats = details_map[sid].get('statistics', {})
-                            content = details_map[sid].get('contentDetails', {})
-                            
-                            video['view_count'] = int(stats.get('viewCount', 0))
-                            
-                            # Parse duration
-                            duration_iso = content.get('duration', 'PT0S')
-                            try:
-                                video['duration_seconds'] = isodate.parse_duration(duration_iso).total_seconds()
-                            except:
-                                video['duration_seconds'] = 0
-                        else:
-                            video['view_count'] = 0
-                            video['duration_seconds'] = 0
-                        
-                        videos.append(video)
-
-                total_fetched += len(items)
-                next_page_token = response.get('nextPageToken')
-
-                if not full_scan and total_fetched >= limit:
-                    break
+            if reached_known:
+                break
+
+            # An incremental sync runs until the high-water mark instead
+            if not full_scan and not incremental and total_fetched >= limit:
+                break
+            
+            if not next_page_token:
+                break
                 
-                if not next_page_token:
-                    break
-                    
-                # Creating a break point for safety if full scan is too large (e.g. > 2000)
-                if full_scan and total_fetched > 2000:
-                    print("Safety limit reached (2000 videos). Stopping scan.")
-                    break
+            # Creating a break point for safety if full scan is too large (e.g. > 2000)
+            if (full_scan or incremental) and total_fetched > 2000:
+                print("Safety limit reached (2000 videos). Stopping scan.")
+                break
 
-            return videos
+    def _fetch_playlist_page(self, uploads_playlist_id, page_token, since, stats_cache):
+        """
+        One page of the uploads playlist with stats.
+        Returns (records, next_page_token, reached_known, items_on_page).
+        """
+        request = self.youtube.playlistItems().list(
+            part='snippet',
+            playlistId=uploads_playlist_id,
+            maxResults=50,
+            pageToken=page_token
+        )
+        response = self._execute_conditional(request, 'playlistItems.list')
 
-        except Exception as e:
-            print(f"An error occurred: {e}")
-            return []
+        items = response.get('items', [])
+        fetched = len(items)
+
+        reached_known = False
+        if since:
+            # The uploads playlist is newest first: keep only items newer
+            # than the high-water mark and stop once we reach it
+            new_items = []
+            for item in items:
+                snippet = item['snippet']
+                if (snippet['resourceId']['videoId'] == since['video_id']
+                        or snippet['publishedAt'] <= since['published_at']):
+                    reached_known = True
+                else:
+                    new_items.append(item)
+            items = new_items
+
+        video_ids = [item['snippet']['resourceId']['videoId'] for item in items]
+        
+        # 3. Get Statistics and ContentDetails (Duration)
+        stats = {}
+        if video_ids:
+            if stats_cache is not None:
+                stats_cache.prefetch(video_ids)
+                stats = {vid: stats_cache.get(vid) for vid in video_ids}
+            else:
+                stats = {item['id']: VideoStats.from_item(item) for item in
+                         self.get_video_details(video_ids, part='statistics,contentDetails')}
+        
+        records = []
+        for item, vid in zip(items, video_ids):
+            snippet = item['snippet']
+            video = stats.get(vid)
+            # Title and date as listed in the playlist (the high-water mark uses the latter)
+            records.append(VideoStats(
+                vid, snippet['title'],
+                video.view_count if video else 0,
+                video.duration_seconds if video else 0,
+                snippet['publishedAt'],
+            ))
+        
+        return records, response.get('nextPageToken'), reached_known, fetched
 
 if __name__ == "__main__":
     # Test stub - requires valid API Key